@@ -7,7 +7,24 @@ a = Analysis(['visualizer/brain_tumor_3d.py'],
              pathex=['/Users/adamwolf/Desktop/brain-tumor-3d/'],
              binaries=[],
              datas=[],
-             hiddenimports=[],
+             hiddenimports=[  # imported on first use by visualizer/vtkModules.py
+                            'vtkmodules.vtkCommonCore',
+                            'vtkmodules.vtkCommonDataModel',
+                            'vtkmodules.vtkFiltersCore',
+                            'vtkmodules.vtkFiltersGeneral',
+                            'vtkmodules.vtkFiltersGeometry',
+                            'vtkmodules.vtkIOGeometry',
+                            'vtkmodules.vtkIOImage',
+                            'vtkmodules.vtkIOPLY',
+                            'vtkmodules.vtkIOXML',
+                            'vtkmodules.vtkImagingCore',
+                            'vtkmodules.vtkInteractionStyle',
+                            'vtkmodules.vtkRenderingCore',
+                            'vtkmodules.vtkRenderingImage',
+                            'vtkmodules.vtkRenderingLOD',
+                            'vtkmodules.vtkRenderingOpenGL2',
+                            'vtkmodules.vtkRenderingVolume',
+                            'vtkmodules.vtkRenderingVolumeOpenGL2'],
              hookspath=[],
              runtime_hooks=[],
              excludes=[],
@@ -0,0 +1,580 @@
+import os
+import time
+from functools import partial
+
+import PyQt5.QtWidgets as QtWidgets
+import PyQt5.QtCore as Qt
+from vtkmodules.qt.QVTKRenderWindowInteractor import QVTKRenderWindowInteractor
+import vtkUtils
+from vtkUtils import *
+from config import *
+from SurfaceWorker import *
+from SliceEngine import *
+from DiagnosticsDialog import *
+from StatisticsDialog import *
+
+
+class CaseView(QtWidgets.QFrame):
+    """
+    The 3D view and settings of one case (a bone scan and its mask), shown in a tab of the MainWindow. Its volumes
+    are read through the volume pool of the session, see VolumePool.
+    """
+    # the widgets kept by save_state, the check boxes in the order their handlers are applied by restore_state
+    STATE_SPIN_BOXES = ('bone_threshold_sp', 'bone_opacity_sp', 'bone_smoothness_sp', 'bone_lut_sp', 'mask_opacity_sp',
+                        'mask_smoothness_sp')
+    STATE_CHECK_BOXES = ('bone_projection_cb', 'bone_slicer_cb', 'bone_volume_cb')
+
+    def __init__(self, main_window, case, bone_file, mask_file, state=None):
+        """
+        :param main_window: the MainWindow, whose status bar shows the messages of the case
+        :param case: the id of the case in the volume pool
+        :param state: the settings and camera of the view when the case was unloaded (see save_state), applied by start
+        """
+        QtWidgets.QFrame.__init__(self)
+        self.main_window = main_window
+        self.case = case
+        self.bone_file = bone_file
+        self.mask_file = mask_file
+
+        # base setup
+        self.renderer, self.vtk_widget, self.interactor, self.render_window = self.setup()
+        self.setAutoFillBackground(True)
+        if vtkUtils.volume_pool:
+            vtkUtils.volume_pool.open_case(case, (bone_file, mask_file))
+        self.state = state
+        self.triangle_budget = state['triangle_budget'] if state else SCENE_TRIANGLE_BUDGET
+        self.bone, self.mask = setup_scene(self.renderer, bone_file, mask_file, self.triangle_budget)
+        self.scene_time = time.perf_counter()
+
+        # the projection, slicer and volume rendering are built the first time they are switched on
+        self.bone_image_prop = None
+        self.bone_slicer_props = None
+        self.slice_engine = None
+        self.bone_volume = None
+        self.slicer_widgets = []
+        self.diagnostics_dialog = None
+        self.statistics_dialog = None
+        self.surface_worker = SurfaceWorker()
+        self.prefetch_timer = Qt.QTimer()
+        self.prefetch_timer.setSingleShot(True)
+        self.prefetch_timer.timeout.connect(self.prefetch_bone_surfaces)
+
+        # bone pickers
+        self.bone_threshold_sp = self.create_new_picker(self.bone.scalar_range[1], self.bone.scalar_range[0], 5.0,
+                                                         sum(self.bone.scalar_range) / 2, self.bone_threshold_vc)
+        self.bone_opacity_sp = self.create_new_picker(1.0, 0.0, 0.1, BONE_OPACITY, self.bone_opacity_vc)
+        self.bone_smoothness_sp = self.create_new_picker(1000, 100, 100, BONE_SMOOTHNESS, self.bone_smoothness_vc)
+        self.bone_lut_sp = self.create_new_picker(3.0, 0.0, 0.1, 2.0, self.lut_value_changed)
+        self.bone_projection_cb = self.add_bone_projection()
+        self.bone_slicer_cb = self.add_bone_slicer()
+        self.bone_volume_cb = self.add_bone_volume()
+
+        # mask pickers
+        self.mask_opacity_sp = self.create_new_picker(1.0, 0.0, 0.1, MASK_OPACITY, self.mask_opacity_vc)
+        self.mask_smoothness_sp = self.create_new_picker(1000, 100, 100, MASK_SMOOTHNESS, self.mask_smoothness_vc)
+        self.mask_label_cbs = []
+
+        # create grid for all widgets
+        self.grid = QtWidgets.QGridLayout()
+
+        # add each widget
+        self.add_vtk_window_widget()
+        self.add_bone_settings_widget()
+        self.add_mask_settings_widget()
+        self.add_views_widget()
+
+        #  set layout
+        self.setLayout(self.grid)
+
+    def start(self):
+        """
+        Renders the first frame, once the view is shown in its tab, with the state the case was unloaded with if any.
+        """
+        if self.state:
+            self.restore_state(self.state)
+        else:
+            self.set_axial_view()
+        self.interactor.Initialize()
+        self.tune_triangle_budget()
+
+    def save_state(self):
+        """
+        :return: dict with the settings, shown labels, slice positions and camera of the view, see restore_state
+        """
+        camera = self.renderer.GetActiveCamera()
+        return {'triangle_budget': self.triangle_budget,
+                'spin_boxes': {name: getattr(self, name).value() for name in self.STATE_SPIN_BOXES},
+                'check_boxes': {name: getattr(self, name).isChecked() for name in self.STATE_CHECK_BOXES},
+                'slices': [widget.value() for widget in self.slicer_widgets],
+                'single_color': self.mask_single_color_radio.isChecked(),
+                'labels': [cb.isChecked() for cb in self.mask_label_cbs],
+                'camera': (camera.GetPosition(), camera.GetFocalPoint(), camera.GetViewUp(), camera.GetViewAngle())}
+
+    def restore_state(self, state):
+        """
+        Applies a state from save_state: sets the widgets without their signals, then updates the scene once. The
+        surfaces come back from the surface and mesh caches when they were built with the same settings.
+        """
+        widget_values = [(getattr(self, name), value) for name, value in state['spin_boxes'].items()]
+        for widget, value in widget_values + list(zip(self.slicer_widgets, state['slices'])):
+            widget.blockSignals(True)
+            widget.setValue(value)
+            widget.blockSignals(False)
+        for cb, checked in zip(self.mask_label_cbs, state['labels']):
+            cb.setChecked(checked)
+        self.mask_single_color_radio.setChecked(state['single_color'])
+        if state['single_color']:
+            self.mask_single_color_radio_checked()
+
+        self.lut_value_changed()
+        self.bone_opacity_vc()
+        self.mask_opacity_vc()
+        self.mask_label_checked()
+        if self.mask_smoothness_sp.value() != MASK_SMOOTHNESS:
+            self.mask_smoothness_vc()
+        for name, handler in zip(self.STATE_CHECK_BOXES, (self.bone_projection_vc, self.bone_slicer_vc,
+                                                           self.bone_volume_vc)):
+            getattr(self, name).setChecked(state['check_boxes'][name])
+            if state['check_boxes'][name]:
+                handler()
+        bone_label = self.bone.labels[0]
+        if not self.bone_volume_cb.isChecked() and \
+                (self.bone_threshold_sp.value() != round(bone_label.value, self.bone_threshold_sp.decimals()) or
+                 self.bone_smoothness_sp.value() != bone_label.smoothness):
+            self.update_bone_surface()
+
+        position, focal_point, view_up, view_angle = state['camera']
+        camera = self.renderer.GetActiveCamera()
+        camera.SetPosition(position)
+        camera.SetFocalPoint(focal_point)
+        camera.SetViewUp(view_up)
+        camera.SetViewAngle(view_angle)
+        self.renderer.ResetCameraClippingRange()
+        self.render_window.Render()
+
+    def unload(self):
+        """
+        Stops the background work of the case and releases its volumes, meshes and render window. The view cannot be
+        used afterwards.
+        """
+        self.surface_worker.close()
+        self.prefetch_timer.stop()
+        for dialog in (self.diagnostics_dialog, self.statistics_dialog):
+            if dialog:
+                dialog.close()
+        self.renderer.RemoveAllViewProps()
+        self.render_window.Finalize()
+        self.bone = self.mask = self.slice_engine = self.bone_volume = None
+
+    def mesh_size(self):
+        """
+        :return: bytes used by the meshes the case shows
+        """
+        return sum(label.actor.GetMapper().GetInput().GetActualMemorySize() * 1024
+                   for nii_object in (self.bone, self.mask) if nii_object
+                   for label in nii_object.labels if label.actor)
+
+    def statusBar(self):
+        return self.main_window.statusBar()
+
+    @staticmethod
+    def setup():
+        """
+        Create and setup the base vtk and Qt objects for the application
+        """
+        renderer = vtk.vtkRenderer()
+        vtk_widget = QVTKRenderWindowInteractor()
+        interactor = vtk_widget.GetRenderWindow().GetInteractor()
+        render_window = vtk_widget.GetRenderWindow()
+
+        vtk_widget.GetRenderWindow().AddRenderer(renderer)
+        render_window.AddRenderer(renderer)
+        interactor.SetRenderWindow(render_window)
+        interactor.SetInteractorStyle(vtk.vtkInteractorStyleTrackballCamera())
+        interactor.SetDesiredUpdateRate(INTERACTIVE_UPDATE_RATE)  # drives the level of detail of the actors
+
+
+
+        return renderer, vtk_widget, interactor, render_window
+
+    def lut_value_changed(self):
+        lut = self.bone.lookup_table
+        new_lut_value = self.bone_lut_sp.value()
+        lut.SetValueRange(0.0, new_lut_value)
+        lut.Build()
+        self.render_window.Render()
+
+    def add_bone_slicer(self):
+        slicer_cb = QtWidgets.QCheckBox("Slicer")
+        slicer_cb.clicked.connect(self.bone_slicer_vc)
+        return slicer_cb
+
+    def add_bone_volume(self):
+        volume_cb = QtWidgets.QCheckBox("Volume Rendering")
+        volume_cb.clicked.connect(self.bone_volume_vc)
+        return volume_cb
+
+    def add_vtk_window_widget(self):
+        base_bone_file = os.path.basename(self.bone_file)
+        base_mask_file = os.path.basename(self.mask_file)
+        object_title = "Bone: {0} (min: {1:.2f}, max: {2:.2f})        Mask: {3}".format(base_bone_file,
+                                                                                         self.bone.scalar_range[0],
+                                                                                         self.bone.scalar_range[1],
+                                                                                         base_mask_file)
+        object_group_box = QtWidgets.QGroupBox(object_title)
+        object_layout = QtWidgets.QVBoxLayout()
+        object_layout.addWidget(self.vtk_widget)
+        object_group_box.setLayout(object_layout)
+        self.grid.addWidget(object_group_box, 0, 2, 5, 5)
+
+        self.grid.setColumnMinimumWidth(2, 700)
+
+    def add_bone_settings_widget(self):
+        bone_group_box = QtWidgets.QGroupBox("Bone Settings")
+        bone_group_layout = QtWidgets.QGridLayout()
+        bone_group_layout.addWidget(QtWidgets.QLabel("Bone Threshold"), 0, 0)
+        bone_group_layout.addWidget(QtWidgets.QLabel("Bone Opacity"), 1, 0)
+        bone_group_layout.addWidget(QtWidgets.QLabel("Bone Smoothness"), 2, 0)
+        bone_group_layout.addWidget(QtWidgets.QLabel("Image Intensity"), 3, 0)
+        bone_group_layout.addWidget(self.bone_threshold_sp, 0, 1, 1, 2)
+        bone_group_layout.addWidget(self.bone_opacity_sp, 1, 1, 1, 2)
+        bone_group_layout.addWidget(self.bone_smoothness_sp, 2, 1, 1, 2)
+        bone_group_layout.addWidget(self.bone_lut_sp, 3, 1, 1, 2)
+        bone_group_layout.addWidget(self.bone_projection_cb, 4, 0)
+        bone_group_layout.addWidget(self.bone_slicer_cb, 4, 1)
+        bone_group_layout.addWidget(self.bone_volume_cb, 4, 2)
+        bone_group_layout.addWidget(self.create_new_separator(), 5, 0, 1, 3)
+        bone_group_layout.addWidget(QtWidgets.QLabel("Axial Slice"), 6, 0)
+        bone_group_layout.addWidget(QtWidgets.QLabel("Coronal Slice"), 7, 0)
+        bone_group_layout.addWidget(QtWidgets.QLabel("Sagittal Slice"), 8, 0)
+
+        slicer_funcs = [self.axial_slice_changed, self.coronal_slice_changed, self.sagittal_slice_changed]
+        current_label_row = 6
+       
+
+        extent_index = 5
+        for func in slicer_funcs:
+            slice_widget = QtWidgets.QSlider(Qt.Qt.Horizontal)
+            slice_widget.setDisabled(True)
+            self.slicer_widgets.append(slice_widget)
+            bone_group_layout.addWidget(slice_widget, current_label_row, 1, 1, 2)
+            slice_widget.valueChanged.connect(func)
+            slice_widget.sliderReleased.connect(self.slice_drag_finished)
+            slice_widget.setRange(self.bone.extent[extent_index - 1], self.bone.extent[extent_index])
+            slice_widget.setValue(int(self.bone.extent[extent_index] / 2))
+            current_label_row += 1
+            extent_index -= 2
+
+        bone_group_box.setLayout(bone_group_layout)
+        self.grid.addWidget(bone_group_box, 0, 0, 1, 2)
+
+    def axial_slice_changed(self):
+        if self.slice_engine:
+            self.slice_engine.set_slice(0, self.slicer_widgets[0].value())
+
+    def coronal_slice_changed(self):
+        if self.slice_engine:
+            self.slice_engine.set_slice(1, self.slicer_widgets[1].value())
+
+    def sagittal_slice_changed(self):
+        if self.slice_engine:
+            self.slice_engine.set_slice(2, self.slicer_widgets[2].value())
+
+    def slice_drag_finished(self):
+        report = self.slice_engine.end_drag() if self.slice_engine else ""
+        if report:
+            self.statusBar().showMessage(report)
+
+    def add_mask_settings_widget(self):
+        mask_settings_group_box = QtWidgets.QGroupBox("Mask Settings")
+        mask_settings_layout = QtWidgets.QGridLayout()
+        mask_settings_layout.addWidget(QtWidgets.QLabel("Mask Opacity"), 0, 0)
+        mask_settings_layout.addWidget(QtWidgets.QLabel("Mask Smoothness"), 1, 0)
+        mask_settings_layout.addWidget(self.mask_opacity_sp, 0, 1)
+        mask_settings_layout.addWidget(self.mask_smoothness_sp, 1, 1)
+        mask_multi_color_radio = QtWidgets.QRadioButton("Multi Color")
+        mask_multi_color_radio.setChecked(True)
+        mask_multi_color_radio.clicked.connect(self.mask_multi_color_radio_checked)
+        self.mask_single_color_radio = QtWidgets.QRadioButton("Single Color")
+        self.mask_single_color_radio.clicked.connect(self.mask_single_color_radio_checked)
+        mask_settings_layout.addWidget(mask_multi_color_radio, 2, 0)
+        mask_settings_layout.addWidget(self.mask_single_color_radio, 2, 1)
+        mask_settings_layout.addWidget(self.create_new_separator(), 3, 0, 1, 2)
+
+        # one checkbox per label, in a scroll area so masks with hundreds of labels fit
+        labels_widget = QtWidgets.QWidget()
+        labels_layout = QtWidgets.QGridLayout()
+        self.mask_label_cbs = []
+        for i, label in enumerate(self.mask.labels):
+            cb = QtWidgets.QCheckBox("Label {}".format(label.value))
+            cb.setChecked(label.actor is not None)
+            cb.clicked.connect(self.mask_label_checked)
+            self.mask_label_cbs.append(cb)
+            labels_layout.addWidget(cb, i // 2, i % 2)
+        labels_widget.setLayout(labels_layout)
+        labels_scroll = QtWidgets.QScrollArea()
+        labels_scroll.setWidget(labels_widget)
+        labels_scroll.setWidgetResizable(True)
+        mask_settings_layout.addWidget(labels_scroll, 4, 0, 1, 2)
+
+        mask_settings_group_box.setLayout(mask_settings_layout)
+        self.grid.addWidget(mask_settings_group_box, 1, 0, 2, 2)
+
+    def add_views_widget(self):
+        axial_view = QtWidgets.QPushButton("Axial")
+        coronal_view = QtWidgets.QPushButton("Coronal")
+        sagittal_view = QtWidgets.QPushButton("Sagittal")
+        views_box = QtWidgets.QGroupBox("Views")
+        views_box_layout = QtWidgets.QVBoxLayout()
+        views_box_layout.addWidget(axial_view)
+        views_box_layout.addWidget(coronal_view)
+        views_box_layout.addWidget(sagittal_view)
+        statistics = QtWidgets.QPushButton("Label Statistics")
+        views_box_layout.addWidget(statistics)
+        statistics.clicked.connect(self.show_statistics)
+        if pipeline_observer:
+            diagnostics = QtWidgets.QPushButton("Diagnostics")
+            views_box_layout.addWidget(diagnostics)
+            diagnostics.clicked.connect(self.show_diagnostics)
+        views_box.setLayout(views_box_layout)
+        self.grid.addWidget(views_box, 3, 0, 2, 2)
+        axial_view.clicked.connect(self.set_axial_view)
+        coronal_view.clicked.connect(self.set_coronal_view)
+        sagittal_view.clicked.connect(self.set_sagittal_view)
+
+    def show_statistics(self):
+        """
+        Shows the label statistics, computed on the worker thread the first time.
+        """
+        if self.statistics_dialog is None:
+            self.statusBar().showMessage("Computing label statistics ...")
+            self.surface_worker.submit('statistics', lambda cancel: compute_mask_statistics(self.mask, self.bone),
+                                       self.statistics_computed)
+            return
+        self.statistics_dialog.show()
+        self.statistics_dialog.raise_()
+
+    def statistics_computed(self, statistics):
+        self.statistics_dialog = StatisticsDialog(statistics, self)
+        self.statusBar().showMessage("Statistics of {} labels".format(len(statistics)))
+        self.show_statistics()
+
+    def show_diagnostics(self):
+        if self.diagnostics_dialog is None:
+            self.diagnostics_dialog = DiagnosticsDialog(pipeline_observer, self)
+        self.diagnostics_dialog.refresh()
+        self.diagnostics_dialog.show()
+        self.diagnostics_dialog.raise_()
+
+    @staticmethod
+    def create_new_picker(max_value, min_value, step, picker_value, value_changed_func):
+        if isinstance(max_value, int):
+            picker = QtWidgets.QSpinBox()
+        else:
+            picker = QtWidgets.QDoubleSpinBox()
+
+        picker.setMaximum(max_value)
+        picker.setMinimum(min_value)
+        picker.setSingleStep(step)
+        picker.setValue(picker_value)
+        picker.valueChanged.connect(value_changed_func)
+        return picker
+
+    def add_bone_projection(self):
+        projection_cb = QtWidgets.QCheckBox("Projection")
+        projection_cb.clicked.connect(self.bone_projection_vc)
+        return projection_cb
+
+    def mask_label_checked(self):
+        for i, cb in enumerate(self.mask_label_cbs):
+            label = self.mask.labels[i]
+            if cb.isChecked() and not label.actor:
+                job = partial(compute_label_surfaces, self.mask, [i], self.mask_smoothness_sp.value())
+                self.surface_worker.submit(('label', i), job, self.show_mask_surfaces)
+            elif label.property:
+                label.property.SetOpacity(self.mask_opacity_sp.value() if cb.isChecked() else 0)
+        self.render_window.Render()
+
+    def show_mask_surfaces(self, surfaces):
+        for i, (polydata, lod) in surfaces.items():
+            actor = show_surface(self.mask, i, polydata, lod)
+            if not actor:
+                continue
+            if not self.renderer.HasViewProp(actor):
+                self.renderer.AddActor(actor)
+                if self.mask_single_color_radio.isChecked():
+                    actor.GetProperty().SetColor(MASK_COLORS[0])
+            actor.GetProperty().SetOpacity(self.mask_opacity_sp.value() if self.mask_label_cbs[i].isChecked() else 0)
+        self.render_window.Render()
+
+    def mask_single_color_radio_checked(self):
+        for label in self.mask.labels:
+            if label.property:
+                label.property.SetColor(MASK_COLORS[0])
+        self.render_window.Render()
+
+    def mask_multi_color_radio_checked(self):
+        for label in self.mask.labels:
+            if label.property:
+                label.property.SetColor(label.color)
+        self.render_window.Render()
+
+    def bone_projection_vc(self):
+        projection_checked = self.bone_projection_cb.isChecked()
+        if self.bone_image_prop is None:
+            self.bone_image_prop = setup_projection(self.bone, self.renderer)
+        self.bone_slicer_cb.setDisabled(projection_checked)  
+        self.bone_image_prop.SetOpacity(projection_checked)
+        self.render_window.Render()
+
+    def bone_slicer_vc(self):
+        slicer_checked = self.bone_slicer_cb.isChecked()
+        if self.slice_engine is None:
+            self.bone_slicer_props = setup_slicer(self.renderer, self.bone)  # causing issues with rotation
+            self.slice_engine = SliceEngine(self.render_window, self.bone_slicer_props, self.bone.reader.GetOutput(),
+                                            get_volume_array(self.bone))
+            for axis, widget in enumerate(self.slicer_widgets):
+                self.slice_engine.show_slice(axis, widget.value())
+
+        for widget in self.slicer_widgets:
+            widget.setEnabled(slicer_checked)
+
+        self.bone_projection_cb.setDisabled(slicer_checked) 
+        for prop in self.bone_slicer_props:
+            prop.GetProperty().SetOpacity(slicer_checked)
+        self.render_window.Render()
+
+    def bone_volume_vc(self):
+        volume_checked = self.bone_volume_cb.isChecked()
+        if self.bone_volume is None:
+            self.bone_volume = setup_volume_rendering(self.bone, self.renderer)
+        self.bone_smoothness_sp.setDisabled(volume_checked)
+        self.bone_volume.SetVisibility(volume_checked)
+        if volume_checked:
+            set_volume_transfer(self.bone, self.bone_threshold_sp.value(), self.bone_opacity_sp.value())
+            self.bone.labels[0].actor.VisibilityOff()
+            self.render_window.Render()
+        else:
+            self.bone.labels[0].actor.VisibilityOn()
+            self.update_bone_surface()  # the threshold may have changed while the volume was shown
+
+    def bone_opacity_vc(self):
+        opacity = round(self.bone_opacity_sp.value(), 2)
+        if self.bone_volume_cb.isChecked():
+            set_volume_transfer(self.bone, self.bone_threshold_sp.value(), opacity)
+        self.bone.labels[0].property.SetOpacity(opacity)
+        self.render_window.Render()
+
+    def bone_threshold_vc(self):
+        if self.bone_volume_cb.isChecked():
+            set_volume_transfer(self.bone, self.bone_threshold_sp.value(), self.bone_opacity_sp.value())
+            self.render_window.Render()
+            return
+        self.update_bone_surface(PROGRESSIVE_PREVIEW)
+
+    def bone_smoothness_vc(self):
+        self.update_bone_surface()
+
+    def update_bone_surface(self, progressive=False):
+        """
+        Recomputes the bone surface on the worker thread, superseding any computation still running.
+        :param progressive: show coarse previews before the finished surface
+        """
+        compute = compute_bone_surface_progressive if progressive else compute_bone_mesh
+        job = partial(compute, self.bone, self.bone_threshold_sp.value(), self.bone_smoothness_sp.value())
+        self.surface_worker.submit('bone', job, self.show_bone_surface)
+
+    def show_bone_surface(self, mesh):
+        show_surface(self.bone, 0, *mesh)
+        self.render_window.Render()
+        self.statusBar().showMessage(surface_cache.report())
+        self.prefetch_timer.start(PREFETCH_DELAY)
+
+    def prefetch_bone_surfaces(self):
+        """
+        Computes the bone surfaces of the thresholds next to the current one into the surface cache while the user is
+        idle, so stepping the threshold back and forth is instant.
+        """
+        if not self.surface_worker.is_idle():
+            self.prefetch_timer.start(PREFETCH_DELAY)
+            return
+
+        threshold, step = self.bone_threshold_sp.value(), self.bone_threshold_sp.singleStep()
+        thresholds = []
+        for distance in range(1, PREFETCH_RADIUS + 1):
+            for neighbour in (threshold + distance * step, threshold - distance * step):
+                if self.bone_threshold_sp.minimum() <= neighbour <= self.bone_threshold_sp.maximum():
+                    thresholds.append(neighbour)
+        job = partial(prefetch_bone_surfaces, self.bone, thresholds, self.bone_smoothness_sp.value())
+        self.surface_worker.submit('prefetch', job, self.bone_surfaces_prefetched, background=True)
+
+    def bone_surfaces_prefetched(self, computed):
+        self.statusBar().showMessage(surface_cache.report())
+
+    def scene_triangles(self):
+        """
+        :return: the number of triangles of the meshes the case shows
+        """
+        return sum(label.actor.GetMapper().GetInput().GetNumberOfCells()
+                   for nii_object in (self.bone, self.mask) for label in nii_object.labels if label.actor)
+
+    def sample_frame_time(self, frames=BUDGET_SAMPLE_FRAMES):
+        """
+        Renders a warm up frame, which compiles the shaders and is not counted, then frames steady frames.
+        :return: the mean time of the steady frames in seconds
+        """
+        self.render_window.Render()
+        frame_times = []
+        for _ in range(frames):
+            self.render_window.Render()
+            frame_times.append(self.renderer.GetLastRenderTimeInSeconds())
+        return sum(frame_times) / len(frame_times)
+
+    def tune_triangle_budget(self):
+        """
+        Scales the triangle budget by how far the steady frames are from TARGET_FRAME_RATE and, if the scene is too
+        slow, rebuilds its surfaces within the smaller budget on the worker thread. A budget that the meshes already
+        fit in changes nothing, so they keep their cache keys.
+        """
+        frame_time = self.sample_frame_time()
+        budget = tune_triangle_budget(self.triangle_budget, frame_time)
+        if not frame_time or budget >= self.triangle_budget or budget >= self.scene_triangles():
+            return
+        self.triangle_budget = budget
+        apply_triangle_budget([self.bone, self.mask], budget)
+        self.update_bone_surface()
+        self.mask_smoothness_vc()
+        self.statusBar().showMessage("Frame took {:.0f} ms, triangle budget lowered to {}".format(frame_time * 1000,
+                                                                                                   budget))
+
+    def mask_opacity_vc(self):
+        opacity = round(self.mask_opacity_sp.value(), 2)
+        for i, label in enumerate(self.mask.labels):
+            if label.property and self.mask_label_cbs[i].isChecked():
+                label.property.SetOpacity(opacity)
+        self.render_window.Render()
+
+    def mask_smoothness_vc(self):
+        built_labels = [i for i, label in enumerate(self.mask.labels) if label.actor]
+        job = partial(compute_label_surfaces, self.mask, built_labels, self.mask_smoothness_sp.value())
+        self.surface_worker.submit('mask', job, self.show_mask_surfaces)
+
+    def set_axial_view(self):
+        set_axial_camera(self.renderer)
+        self.render_window.Render()
+
+    def set_coronal_view(self):
+        set_coronal_camera(self.renderer)
+        self.render_window.Render()
+
+    def set_sagittal_view(self):
+        set_sagittal_camera(self.renderer)
+        self.render_window.Render()
+
+    @staticmethod
+    def create_new_separator():
+        horizontal_line = QtWidgets.QWidget()
+        horizontal_line.setFixedHeight(1)
+        horizontal_line.setSizePolicy(QtWidgets.QSizePolicy.Expanding, QtWidgets.QSizePolicy.Fixed)
+        horizontal_line.setStyleSheet("background-color: #c8c8c8;")
+        return horizontal_line
@@ -0,0 +1,78 @@
+import PyQt5.QtWidgets as QtWidgets
+import PyQt5.QtCore as Qt
+
+
+class DiagnosticsDialog(QtWidgets.QDialog):
+    """
+    Shows the filter executions recorded by a PipelineObserver, one row per label and filter, and saves them as JSON
+    or as a trace file.
+    """
+    COLUMNS = ("Label", "Filter", "Runs", "Total (ms)", "Max (ms)", "Points", "Cells", "Output (MB)", "RSS growth (MB)")
+
+    def __init__(self, observer, parent=None):
+        """
+        :param observer: the PipelineObserver to show
+        """
+        QtWidgets.QDialog.__init__(self, parent)
+        self.observer = observer
+        self.setWindowTitle("Pipeline Diagnostics")
+        self.resize(900, 500)
+
+        self.table = QtWidgets.QTableWidget(0, len(self.COLUMNS))
+        self.table.setHorizontalHeaderLabels(self.COLUMNS)
+        self.table.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
+        self.table.setSortingEnabled(True)
+        self.table.horizontalHeader().setStretchLastSection(True)
+        self.total_label = QtWidgets.QLabel()
+
+        buttons = QtWidgets.QHBoxLayout()
+        for text, slot in (("Refresh", self.refresh), ("Clear", self.clear), ("Save JSON...", self.save_json),
+                           ("Save Trace...", self.save_trace)):
+            button = QtWidgets.QPushButton(text)
+            button.clicked.connect(slot)
+            buttons.addWidget(button)
+        buttons.addStretch()
+
+        layout = QtWidgets.QVBoxLayout()
+        layout.addWidget(self.table)
+        layout.addWidget(self.total_label)
+        layout.addLayout(buttons)
+        self.setLayout(layout)
+        self.refresh()
+
+    def refresh(self):
+        summary = self.observer.summary()
+        self.table.setSortingEnabled(False)
+        self.table.setRowCount(len(summary))
+        for row, entry in enumerate(summary):
+            values = (entry['label'] or "", entry['filter'], entry['executions'], 1000 * entry['seconds'],
+                      1000 * entry['max_seconds'], entry['points'], entry['cells'],
+                      entry['output_memory'] / 1024 ** 2 if entry['output_memory'] is not None else None,
+                      entry['rss_growth'] / 1024 ** 2)
+            for column, value in enumerate(values):
+                item = QtWidgets.QTableWidgetItem()
+                if isinstance(value, float):
+                    item.setData(Qt.Qt.DisplayRole, round(value, 1))
+                elif value is not None:
+                    item.setData(Qt.Qt.DisplayRole, value)
+                self.table.setItem(row, column, item)
+        self.table.setSortingEnabled(True)
+        self.table.resizeColumnsToContents()
+        self.total_label.setText("{} executions, {:.0f} ms".format(
+            sum(entry['executions'] for entry in summary), 1000 * sum(entry['seconds'] for entry in summary)))
+
+    def clear(self):
+        self.observer.clear()
+        self.refresh()
+
+    def save_json(self):
+        file_name, _ = QtWidgets.QFileDialog.getSaveFileName(self, "Save Diagnostics", "pipeline.json",
+                                                             "JSON (*.json)")
+        if file_name:
+            self.observer.dump_json(file_name)
+
+    def save_trace(self):
+        file_name, _ = QtWidgets.QFileDialog.getSaveFileName(self, "Save Trace", "pipeline_trace.json",
+                                                             "Chrome trace (*.json)")
+        if file_name:
+            self.observer.dump_trace(file_name)
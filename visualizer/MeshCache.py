@@ -0,0 +1,116 @@
+import hashlib
+import os
+
+import vtkModules as vtk
+
+
+class MeshCache:
+    """
+    Content addressed on-disk cache of finished surface meshes (vtkPolyData stored as .vtp files).
+    Entries are keyed by the hash of the input file and the parameters the mesh was built with. When the cache grows
+    past max_size bytes the least recently used entries are removed.
+    """
+    FORMAT = 2  # part of the keys, meshes built from volumes read with flipped slices are not read
+
+    def __init__(self, directory, max_size):
+        self.directory = directory
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def hash_file(file_name, chunk_size=1 << 20):
+        """
+        :return: hex digest of the content of the file
+        """
+        digest = hashlib.blake2b(digest_size=20)
+        with open(file_name, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    @classmethod
+    def key(cls, file_hash, value, smoothness, reduction, smoothing):
+        """
+        :param file_hash: the hash of the input volume (see hash_file)
+        :param value: the label value, or the threshold for thresholded surfaces
+        :param smoothness: the smoothness spin box value
+        :param reduction: the decimation target reduction
+        :param smoothing: the smoothing engine
+        :return: the cache key of the mesh
+        """
+        parameters = repr((cls.FORMAT, file_hash, float(value), int(smoothness), float(reduction), smoothing))
+        return hashlib.sha1(parameters.encode()).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + '.vtp')
+
+    def load(self, key):
+        """
+        Other processes (e.g. batch_export workers) may share the directory and evict an entry at any time, a mesh that
+        disappears while it is loaded counts as a miss.
+        :return: the cached vtkPolyData, or None if the mesh is not in the cache
+        """
+        path = self.path(key)
+        try:
+            os.utime(path)  # mark as recently used
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+
+        reader = vtk.vtkXMLPolyDataReader()
+        reader.AddObserver('ErrorEvent', lambda caller, event: None)  # a removed file reads as an empty mesh
+        reader.SetFileName(path)
+        reader.Update()
+        polydata = reader.GetOutput()
+        if not polydata.GetNumberOfPoints() and not polydata.GetNumberOfCells():
+            self.misses += 1
+            return None
+        self.hits += 1
+        return polydata
+
+    def save(self, key, polydata):
+        """
+        Writes the mesh to the cache and evicts old entries if the cache is over its size limit. Empty meshes are not
+        written, they read as misses (see load) and are quick to compute again.
+        """
+        if not polydata.GetNumberOfPoints() and not polydata.GetNumberOfCells():
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path(key)
+        tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+
+        writer = vtk.vtkXMLPolyDataWriter()
+        writer.SetFileName(tmp_path)
+        writer.SetInputData(polydata)
+        writer.SetDataModeToAppended()
+        writer.EncodeAppendedDataOff()
+        writer.SetCompressorTypeToNone()  # load speed matters more than disk space
+        if writer.Write():
+            os.replace(tmp_path, path)
+            self.evict()
+        elif os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    def evict(self):
+        """
+        Removes the least recently used entries until the cache fits in max_size bytes.
+        """
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.vtp'):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:  # evicted by another process
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total_size -= size
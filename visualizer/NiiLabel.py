@@ -1,8 +1,18 @@
 class NiiLabel:
-    def __init__(self, color, opacity, smoothness):
+    __slots__ = ('value', 'name', 'estimated_triangles', 'max_triangles', 'voi', 'extractor', 'actor', 'property',
+                 'surface', 'decimated', 'color', 'opacity', 'smoothness')
+
+    def __init__(self, color, opacity, smoothness, value=None):
+        self.value = value
+        self.name = None  # e.g. 'bone' or 'label 3', the label of its filter executions, see PipelineObserver
+        self.estimated_triangles = 0
+        self.max_triangles = None
+        self.voi = None
+        self.extractor = None
         self.actor = None
         self.property = None
-        self.smoother = None
+        self.surface = None
+        self.decimated = None  # (value, max_triangles) and the decimated mesh of the surface, see compute_surface
         self.color = color
         self.opacity = opacity
         self.smoothness = smoothness
\ No newline at end of file
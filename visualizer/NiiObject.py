@@ -1,8 +1,18 @@
+from config import *
+
+
 class NiiObject:
+    __slots__ = ('file', 'file_hash', 'reader', 'extent', 'labels', 'lookup_table', 'volume', 'scalar_range',
+                 'previews', 'preview_rate')
+
     def __init__(self):
         self.file = None
+        self.file_hash = None
         self.reader = None
         self.extent = ()
         self.labels = []
-        self.image_mapper = None
+        self.lookup_table = None
+        self.volume = None
         self.scalar_range = None
+        self.previews = {}
+        self.preview_rate = PREVIEW_INITIAL_RATE
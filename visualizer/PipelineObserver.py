@@ -0,0 +1,148 @@
+import json
+import os
+import resource
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+from config import *
+
+
+def current_rss():
+    """
+    :return: the resident memory of the process in bytes (the peak resident memory where /proc is not available)
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class PipelineObserver:
+    """
+    Records every execution of the VTK filters it is attached to: wall time, output points and cells, the memory of
+    the output and the growth of the resident memory of the process while the filter ran. Filters execute lazily when
+    something downstream is updated, so an execution is recorded under the label being computed on the executing
+    thread when it ran (see label), not under the label the filter was created for. The last
+    PIPELINE_DIAGNOSTICS_SIZE executions are kept.
+    """
+    def __init__(self, size=PIPELINE_DIAGNOSTICS_SIZE):
+        self.records = deque(maxlen=size)
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.running = {}
+
+    def attach(self, algorithm):
+        """
+        :return: the algorithm, so filters can be observed where they are created
+        """
+        algorithm.AddObserver('StartEvent', self.start)
+        algorithm.AddObserver('EndEvent', self.end)
+        return algorithm
+
+    @contextmanager
+    def label(self, name):
+        """
+        Records the filters executed by this thread inside the with block under the label name.
+        """
+        previous = getattr(self.local, 'label', None)
+        self.local.label = name
+        try:
+            yield
+        finally:
+            self.local.label = previous
+
+    def start(self, caller, event):
+        self.running[(caller.__this__, threading.get_ident())] = time.perf_counter(), current_rss()
+
+    def end(self, caller, event):
+        started = self.running.pop((caller.__this__, threading.get_ident()), None)
+        if started:
+            self.record(caller.GetClassName(), *started,
+                        output=caller.GetOutputDataObject(0) if caller.GetNumberOfOutputPorts() else None)
+
+    def record(self, name, start, start_rss, output=None):
+        """
+        Records an execution that started at time.perf_counter() start with the resident memory start_rss, e.g. of
+        work done outside of a VTK filter.
+        :param output: the vtkDataObject produced, for its size
+        """
+        end = time.perf_counter()
+        record = {'filter': name, 'label': getattr(self.local, 'label', None), 'start': start, 'seconds': end - start,
+                  'points': None, 'cells': None, 'output_memory': None, 'rss_growth': current_rss() - start_rss,
+                  'pid': os.getpid(), 'thread': threading.get_ident()}
+        if output is not None and hasattr(output, 'GetNumberOfPoints'):
+            record.update(points=output.GetNumberOfPoints(), cells=output.GetNumberOfCells(),
+                          output_memory=output.GetActualMemorySize() * 1024)  # reported in kibibytes
+        with self.lock:
+            self.records.append(record)
+
+    def extend(self, records):
+        """
+        Adds executions recorded by another observer, e.g. in a worker process (see take).
+        """
+        with self.lock:
+            self.records.extend(records)
+
+    def take(self):
+        """
+        :return: the recorded executions, which are removed from the observer
+        """
+        with self.lock:
+            records = list(self.records)
+            self.records.clear()
+        return records
+
+    def clear(self):
+        with self.lock:
+            self.records.clear()
+
+    def summary(self):
+        """
+        :return: one dict per label and filter, in order of first execution, with the number of executions, their
+        total and longest time, the points, cells and output memory of the last one and the total resident memory
+        growth
+        """
+        with self.lock:
+            records = list(self.records)
+        rows = OrderedDict()
+        for record in records:
+            row = rows.setdefault((record['label'], record['filter']), {
+                'label': record['label'], 'filter': record['filter'], 'executions': 0, 'seconds': 0.0,
+                'max_seconds': 0.0, 'rss_growth': 0})
+            row['executions'] += 1
+            row['seconds'] += record['seconds']
+            row['max_seconds'] = max(row['max_seconds'], record['seconds'])
+            row['rss_growth'] += record['rss_growth']
+            row.update(points=record['points'], cells=record['cells'], output_memory=record['output_memory'])
+        return list(rows.values())
+
+    def dump_json(self, file_name):
+        """
+        Writes the summary and every recorded execution, with start times in seconds from the first one.
+        """
+        with self.lock:
+            records = list(self.records)
+        origin = min((record['start'] for record in records), default=0.0)
+        with open(file_name, 'w') as f:
+            json.dump({'summary': self.summary(),
+                       'executions': [dict(record, start=record['start'] - origin) for record in records]}, f,
+                      indent=2)
+
+    def dump_trace(self, file_name):
+        """
+        Writes the executions in the Chrome trace event format, one row per process and thread, to be opened in
+        chrome://tracing or https://ui.perfetto.dev.
+        """
+        with self.lock:
+            records = list(self.records)
+        origin = min((record['start'] for record in records), default=0.0)
+        events = [{'name': record['filter'], 'cat': record['label'] or 'pipeline', 'ph': 'X',
+                   'ts': (record['start'] - origin) * 1e6, 'dur': record['seconds'] * 1e6, 'pid': record['pid'],
+                   'tid': record['thread'],
+                   'args': {key: record[key] for key in ('label', 'points', 'cells', 'output_memory', 'rss_growth')}}
+                  for record in records]
+        with open(file_name, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
@@ -0,0 +1,148 @@
+import time
+from collections import OrderedDict
+
+import numpy as np
+import PyQt5.QtCore as Qt
+import vtkModules as vtk
+from vtkModules import numpy_support
+
+from config import *
+
+
+class SliceEngine(Qt.QObject):
+    """
+    Shows slices of a volume in the axial, coronal and sagittal image actors of setup_slicer.
+    Slider events are coalesced: a new position only records what to show, and the render happens at most once per
+    SLICE_FRAME_INTERVAL with the latest position of every axis. Every shown slice is extracted from the volume into
+    a small 2D image which is kept in an LRU cache, and while a slider is idle the slices next to its position are
+    extracted ahead of time (in the direction of the last move first), so scrubbing back and forth only swaps inputs.
+    The latency from a slider event to the frame showing it is recorded per drag, see end_drag.
+    """
+    AXES = (2, 1, 0)  # volume axis (x, y, z) of the axial, coronal and sagittal actor
+
+    def __init__(self, render_window, actors, image, array):
+        """
+        :param render_window: the vtkRenderWindow showing the actors
+        :param actors: the axial, coronal and sagittal vtkImageActor
+        :param image: the vtkImageData of the volume, for its extent, spacing and origin
+        :param array: the [z, y, x] numpy view of the volume
+        """
+        Qt.QObject.__init__(self)
+        self.render_window = render_window
+        self.actors = actors
+        self.extent = image.GetExtent()
+        self.spacing = image.GetSpacing()
+        self.origin = image.GetOrigin()
+        self.array = array
+        self.cache = OrderedDict()
+        self.pending = {}
+        self.positions = {}
+        self.directions = {}
+        self.event_time = None
+        self.frame_time = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.latencies = []
+
+        self.frame_timer = Qt.QTimer()
+        self.frame_timer.setSingleShot(True)
+        self.frame_timer.timeout.connect(self.render)
+        self.prefetch_timer = Qt.QTimer()
+        self.prefetch_timer.setSingleShot(True)
+        self.prefetch_timer.timeout.connect(self.prefetch)
+
+    def set_slice(self, axis, position):
+        """
+        Requests a slice, it is shown with the next frame.
+        :param axis: 0, 1 or 2 for the axial, coronal or sagittal actor
+        :param position: the slice index along the axis of the actor
+        """
+        if axis in self.positions and position != self.positions[axis]:
+            self.directions[axis] = 1 if position > self.positions[axis] else -1
+        self.pending[axis] = position
+        if self.event_time is None:
+            self.event_time = time.perf_counter()
+        if not self.frame_timer.isActive():
+            since_frame = (self.event_time - self.frame_time) * 1000
+            self.frame_timer.start(max(0, int(SLICE_FRAME_INTERVAL - since_frame)))
+
+    def render(self):
+        for axis, position in self.pending.items():
+            self.show_slice(axis, position)
+        self.pending.clear()
+        self.render_window.Render()
+        self.frame_time = time.perf_counter()
+        if self.event_time is not None:
+            self.latencies.append(time.perf_counter() - self.event_time)
+            self.event_time = None
+        self.prefetch_timer.start(0)
+
+    def show_slice(self, axis, position):
+        image = self.cache.get((axis, position))
+        if image is None:
+            self.misses += 1
+            image = self.extract_slice(axis, position)
+        else:
+            self.hits += 1
+            self.cache.move_to_end((axis, position))
+        self.actors[axis].SetInputData(image)
+        self.actors[axis].SetDisplayExtent(image.GetExtent())
+        self.positions[axis] = position
+
+    def slice_extent(self, axis, position):
+        extent = list(self.extent)
+        volume_axis = self.AXES[axis]
+        extent[2 * volume_axis] = extent[2 * volume_axis + 1] = position
+        return extent
+
+    def extract_slice(self, axis, position):
+        """
+        Copies one slice of the volume into its own vtkImageData and caches it.
+        """
+        extent = self.slice_extent(axis, position)
+        index = [slice(None)] * 3
+        index[2 - self.AXES[axis]] = slice(position - self.extent[2 * self.AXES[axis]],
+                                           position - self.extent[2 * self.AXES[axis]] + 1)
+        data = np.ascontiguousarray(self.array[tuple(index)])
+
+        image = vtk.vtkImageData()
+        image.SetExtent(extent)
+        image.SetSpacing(self.spacing)
+        image.SetOrigin(self.origin)
+        image.GetPointData().SetScalars(numpy_support.numpy_to_vtk(
+            data.ravel(), deep=True, array_type=numpy_support.get_vtk_array_type(data.dtype)))
+
+        self.cache[(axis, position)] = image
+        while len(self.cache) > SLICE_CACHE_SIZE:
+            self.cache.popitem(last=False)
+        return image
+
+    def prefetch(self):
+        """
+        Extracts one missing neighbour slice per call and reschedules itself until all slices within
+        SLICE_PREFETCH_RADIUS of the shown ones are cached, so it never blocks the event loop for long.
+        """
+        if self.pending:
+            return
+        for axis, position in self.positions.items():
+            direction = self.directions.get(axis, 1)
+            low, high = self.extent[2 * self.AXES[axis]], self.extent[2 * self.AXES[axis] + 1]
+            for distance in range(1, SLICE_PREFETCH_RADIUS + 1):
+                for neighbour in (position + direction * distance, position - direction * distance):
+                    if low <= neighbour <= high and (axis, neighbour) not in self.cache:
+                        self.extract_slice(axis, neighbour)
+                        self.prefetch_timer.start(0)
+                        return
+
+    def end_drag(self):
+        """
+        :return: a one line summary of the frame latency and slice cache hits since the last call
+        """
+        latencies, self.latencies = self.latencies, []
+        hits, lookups = self.hits, self.hits + self.misses
+        self.hits = self.misses = 0
+        if not latencies:
+            return ""
+        return "Slices: {} frames, latency mean {:.0f} ms, max {:.0f} ms, {:.0%} cached".format(
+            len(latencies), 1000 * sum(latencies) / len(latencies), 1000 * max(latencies),
+            hits / lookups if lookups else 0.0)
@@ -0,0 +1,70 @@
+import csv
+
+import PyQt5.QtWidgets as QtWidgets
+import PyQt5.QtCore as Qt
+
+
+class StatisticsDialog(QtWidgets.QDialog):
+    """
+    Shows the statistics of every mask label (see vtkUtils.compute_mask_statistics), one sortable row per label, and
+    saves them as CSV.
+    """
+    COLUMNS = ("Label", "Voxels", "Volume (mm³)", "Centroid x", "Centroid y", "Centroid z", "Mean", "Std", "Min",
+               "Max")
+
+    def __init__(self, statistics, parent=None):
+        """
+        :param statistics: dict of label value -> statistics
+        """
+        QtWidgets.QDialog.__init__(self, parent)
+        self.statistics = statistics
+        self.setWindowTitle("Label Statistics")
+        self.resize(900, 500)
+
+        self.table = QtWidgets.QTableWidget(0, len(self.COLUMNS))
+        self.table.setHorizontalHeaderLabels(self.COLUMNS)
+        self.table.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
+        self.table.horizontalHeader().setStretchLastSection(True)
+        save = QtWidgets.QPushButton("Save CSV...")
+        save.clicked.connect(self.save_csv)
+
+        buttons = QtWidgets.QHBoxLayout()
+        buttons.addWidget(save)
+        buttons.addStretch()
+        layout = QtWidgets.QVBoxLayout()
+        layout.addWidget(self.table)
+        layout.addLayout(buttons)
+        self.setLayout(layout)
+        self.fill()
+
+    def rows(self):
+        """
+        :return: one tuple of COLUMNS values per label, None where a value is not known (intensities without a scan)
+        """
+        return [(value, label['voxels'], label['volume']) + label['centroid'] +
+                tuple(label.get(key) for key in ('mean', 'std', 'min', 'max'))
+                for value, label in sorted(self.statistics.items())]
+
+    def fill(self):
+        rows = self.rows()
+        self.table.setRowCount(len(rows))
+        for row, values in enumerate(rows):
+            for column, value in enumerate(values):
+                item = QtWidgets.QTableWidgetItem()
+                if isinstance(value, float):
+                    item.setData(Qt.Qt.DisplayRole, round(value, 2))
+                elif value is not None:
+                    item.setData(Qt.Qt.DisplayRole, value)
+                self.table.setItem(row, column, item)
+        self.table.setSortingEnabled(True)
+        self.table.resizeColumnsToContents()
+
+    def save_csv(self):
+        file_name, _ = QtWidgets.QFileDialog.getSaveFileName(self, "Save Statistics", "label_statistics.csv",
+                                                             "CSV (*.csv)")
+        if not file_name:
+            return
+        with open(file_name, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(self.COLUMNS)
+            writer.writerows(self.rows())
@@ -0,0 +1,64 @@
+import threading
+from collections import OrderedDict
+
+
+class SurfaceCache:
+    """
+    In-memory LRU cache of finished surface meshes (vtkPolyData), bounded by the memory the meshes use.
+    Safe to use from the surface worker thread and the Qt thread at the same time.
+    """
+    def __init__(self, max_size):
+        """
+        :param max_size: memory ceiling in bytes, least recently used meshes are dropped above it
+        """
+        self.max_size = max_size
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def key(file, value, smoothness, reduction, smoothing):
+        return file, float(value), int(smoothness), float(reduction), smoothing
+
+    def __contains__(self, key):
+        with self.lock:
+            return key in self.entries
+
+    def get(self, key):
+        """
+        :return: the cached vtkPolyData, or None if the mesh is not in the cache
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, polydata):
+        size = polydata.GetActualMemorySize() * 1024  # reported in kibibytes
+        with self.lock:
+            if key in self.entries:
+                self.size -= self.entries.pop(key)[1]
+            if size > self.max_size:
+                return
+            self.entries[key] = (polydata, size)
+            self.size += size
+            while self.size > self.max_size:
+                self.size -= self.entries.popitem(last=False)[1][1]
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def report(self):
+        """
+        :return: a one line summary of the hit rate and memory use
+        """
+        return "Surface cache: {:.0%} hits ({}/{}), {} meshes, {:.1f} / {:.0f} MB".format(
+            self.hit_rate(), self.hits, self.hits + self.misses, len(self.entries), self.size / 1024 ** 2,
+            self.max_size / 1024 ** 2)
@@ -0,0 +1,96 @@
+import inspect
+import threading
+import traceback
+from collections import OrderedDict
+
+import PyQt5.QtCore as Qt
+
+
+class SurfaceWorker(Qt.QObject):
+    """
+    Runs surface computations on a background thread so the VTK pipeline does not block the Qt event loop.
+    Jobs are submitted under a key (e.g. 'bone'); a newer job with the same key replaces a queued one and cancels a
+    running one, so only the latest request of each key delivers its result. Results are handed to the callback on the
+    Qt thread, where it is safe to swap them into actors and render. A job that returns a generator delivers every
+    value it yields, e.g. a coarse preview followed by the full resolution result. Background jobs (e.g. prefetching)
+    are cancelled as soon as any other job is submitted.
+    """
+    finished = Qt.pyqtSignal(object, int, object, object)  # key, generation, callback, result
+
+    def __init__(self):
+        Qt.QObject.__init__(self)
+        self.generation = 0
+        self.latest = {}
+        self.pending = OrderedDict()
+        self.running = None
+        self.closed = False
+        self.condition = threading.Condition()
+        self.finished.connect(self.deliver)
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def submit(self, key, job, callback, background=False):
+        """
+        :param key: jobs with the same key supersede each other
+        :param job: callable run on the worker thread as job(cancel), where cancel is a threading.Event that is set
+        when the job is superseded. The job can return early once it is set.
+        :param callback: called on the Qt thread as callback(result) if the job was not superseded
+        :param background: the job is cancelled when any other job is submitted
+        """
+        with self.condition:
+            self.generation += 1
+            self.latest[key] = self.generation
+            for pending_key in [k for k, pending in self.pending.items() if k == key or pending[3]]:
+                del self.pending[pending_key]
+            self.pending[key] = (self.generation, job, callback, background)
+            if self.running and (self.running[0] == key or self.running[2]):
+                self.running[1].set()
+            self.condition.notify()
+
+    def close(self):
+        """
+        Cancels the running job, drops the queued ones and stops the worker thread. No callback is called after this.
+        """
+        with self.condition:
+            self.closed = True
+            self.pending.clear()
+            if self.running:
+                self.running[1].set()
+            self.condition.notify()
+
+    def is_idle(self):
+        with self.condition:
+            return not self.pending and not self.running
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.pending and not self.closed:
+                    self.condition.wait()
+                if self.closed:
+                    return
+                key, (generation, job, callback, background) = self.pending.popitem(last=False)
+                cancel = threading.Event()
+                self.running = (key, cancel, background)
+
+            try:
+                result = job(cancel)
+                if inspect.isgenerator(result):
+                    for stage in result:
+                        if cancel.is_set():
+                            break
+                        self.finished.emit(key, generation, callback, stage)
+                elif not cancel.is_set():
+                    self.finished.emit(key, generation, callback, result)
+            except Exception as e:  # keep the worker alive, report on the Qt thread
+                self.finished.emit(key, generation, callback, e)
+            with self.condition:
+                self.running = None
+
+    def deliver(self, key, generation, callback, result):
+        if self.closed or self.latest.get(key) != generation:
+            return
+        if isinstance(result, Exception):
+            traceback.print_exception(type(result), result, result.__traceback__)
+            return
+        callback(result)
@@ -0,0 +1,107 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from niftiUtils import create_image_import
+from vtkModules import numpy_support
+
+
+class VolumeCache:
+    """
+    On-disk cache of decoded volumes, stored uncompressed as .npy files (plus a .json file with the image geometry) so
+    they open as memory maps. Entries are keyed by the path, size and modification time of the input file, so a changed
+    file is converted again. When the cache grows past max_size bytes the least recently used entries are removed.
+    """
+    FORMAT = 2  # part of the keys, entries written by an older reader (e.g. with flipped slices) are not read
+
+    def __init__(self, directory, max_size):
+        self.directory = directory
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def key(cls, file_name):
+        """
+        :return: the cache key of the current version of the file
+        """
+        stat = os.stat(file_name)
+        parameters = repr((cls.FORMAT, os.path.abspath(file_name), stat.st_size, stat.st_mtime_ns))
+        return hashlib.sha1(parameters.encode()).hexdigest()
+
+    def path(self, key, extension):
+        return os.path.join(self.directory, key + extension)
+
+    def load(self, file_name):
+        """
+        :return: a vtkImageImport producing the cached volume of the file (memory-mapped), or None if it is not cached
+        """
+        key = self.key(file_name)
+        try:
+            with open(self.path(key, '.json')) as f:
+                geometry = json.load(f)
+            array = np.load(self.path(key, '.npy'), mmap_mode='c')
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+
+        try:
+            os.utime(self.path(key, '.npy'))  # mark as recently used
+        except FileNotFoundError:  # evicted by another process, the open memory map stays valid
+            pass
+        self.hits += 1
+        return create_image_import(array, geometry['spacing'], geometry['origin'])
+
+    def save(self, file_name, image):
+        """
+        Writes the volume of an image read from the file to the cache and evicts old entries if the cache is over its
+        size limit. Images with more than one component (e.g. 4D volumes) are not cached.
+        :param image: the vtkImageData read from the file
+        """
+        scalars = image.GetPointData().GetScalars()
+        if scalars is None or scalars.GetNumberOfComponents() != 1:
+            return
+        x0, x1, y0, y1, z0, z1 = image.GetExtent()
+        array = numpy_support.vtk_to_numpy(scalars).reshape(z1 - z0 + 1, y1 - y0 + 1, x1 - x0 + 1)
+
+        os.makedirs(self.directory, exist_ok=True)
+        key = self.key(file_name)
+        tmp_path = '{}.{}.tmp'.format(self.path(key, '.npy'), os.getpid())
+        try:
+            with open(tmp_path, 'wb') as f:
+                np.save(f, array)
+            with open(self.path(key, '.json'), 'w') as f:
+                json.dump({'file': os.path.abspath(file_name), 'spacing': image.GetSpacing(),
+                           'origin': image.GetOrigin()}, f)
+            os.replace(tmp_path, self.path(key, '.npy'))
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        self.evict()
+
+    def evict(self):
+        """
+        Removes the least recently used entries until the cache fits in max_size bytes.
+        """
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.npy'):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:  # evicted by another process
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            for file_name in (path, path[:-len('.npy')] + '.json'):
+                try:
+                    os.remove(file_name)
+                except FileNotFoundError:
+                    pass
+            total_size -= size
@@ -0,0 +1,98 @@
+import os
+import threading
+from collections import OrderedDict
+
+
+class VolumePool:
+    """
+    The volumes and meshes of the cases open in a session, within a memory limit. A volume is read once and shared by
+    every case opening the same file. Cases are kept in least recently used order; when the volumes and meshes of the
+    loaded cases use more than max_size bytes, evict returns the least recently used inactive cases, which release
+    their volumes (unless another loaded case uses them) and meshes. An evicted case reloads its volumes through the
+    pool when it is revisited, and its meshes come back from the surface and mesh caches.
+    Safe to use from the surface worker thread and the Qt thread at the same time.
+    """
+    def __init__(self, max_size):
+        """
+        :param max_size: memory ceiling in bytes of the volumes and meshes of the loaded cases
+        """
+        self.max_size = max_size
+        self.volumes = {}  # file -> (image source, bytes)
+        self.cases = OrderedDict()  # case -> [files, mesh bytes], least recently used first
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def key(file_name):
+        return os.path.abspath(file_name)
+
+    def open_case(self, case, files):
+        """
+        Registers a case before its volumes are read, and makes it the most recently used one.
+        :param files: the volume files of the case
+        """
+        with self.lock:
+            self.cases[case] = [{self.key(file) for file in files if file}, 0]
+            self.cases.move_to_end(case)
+
+    def touch(self, case):
+        with self.lock:
+            if case in self.cases:
+                self.cases.move_to_end(case)
+
+    def set_mesh_size(self, case, size):
+        """
+        :param size: bytes used by the meshes the case shows
+        """
+        with self.lock:
+            if case in self.cases:
+                self.cases[case][1] = size
+
+    def get(self, file_name):
+        """
+        :return: the image source of a volume read by a loaded case, or None
+        """
+        with self.lock:
+            entry = self.volumes.get(self.key(file_name))
+            return entry[0] if entry else None
+
+    def put(self, file_name, reader):
+        with self.lock:
+            self.volumes[self.key(file_name)] = (reader, reader.GetOutput().GetActualMemorySize() * 1024)
+
+    def release(self, case):
+        """
+        Forgets a case, and the volumes no other case uses.
+        """
+        with self.lock:
+            self.cases.pop(case, None)
+            used = set().union(*(files for files, _ in self.cases.values()))
+            for key in [key for key in self.volumes if key not in used]:
+                del self.volumes[key]
+
+    def size(self):
+        with self.lock:
+            return sum(size for _, size in self.volumes.values()) + \
+                   sum(mesh_size for _, mesh_size in self.cases.values())
+
+    def evict(self, active):
+        """
+        Releases the least recently used cases other than the active one until the pool fits in max_size.
+        :return: the evicted cases, which have to drop their volumes and meshes
+        """
+        evicted = []
+        for case in list(self.cases):
+            if self.size() <= self.max_size:
+                break
+            if case != active:
+                self.release(case)
+                evicted.append(case)
+        return evicted
+
+    def report(self):
+        """
+        :return: a one line summary of the loaded cases and memory use
+        """
+        with self.lock:
+            cases, volumes = len(self.cases), len(self.volumes)
+        return "Volume pool: {} cases loaded, {} volumes, {:.0f} / {:.0f} MB".format(
+            cases, volumes, self.size() / 1024 ** 2, self.max_size / 1024 ** 2)
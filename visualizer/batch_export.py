@@ -0,0 +1,167 @@
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import vtkUtils
+from vtkUtils import *
+
+'''
+Exports the surfaces of many bone/mask cases without a window:
+
+    case -> read_bone / read_mask -> triangle budget -> compute_surface per label -> mesh files
+
+Cases run in parallel worker processes, one case per worker. The meshes are built exactly as in the viewer
+(same extraction, budget, decimation and smoothing). The viewer's mesh cache is not used by default, since a large
+batch would evict the meshes of the cases being worked on; with --cache a batch run warms it for opening the cases.
+'''
+
+MESH_WRITERS = {'vtp': vtk.vtkXMLPolyDataWriter, 'stl': vtk.vtkSTLWriter, 'ply': vtk.vtkPLYWriter}
+
+
+def find_cases(directory):
+    """
+    Finds the cases of a data directory laid out like sample_data: masks in labels/, scans in images/. A mask
+    'colonl.nii.gz' is paired with the scan 'colon.nii.gz' or 'colonl.nii.gz' if there is one.
+    :return: list of dicts with the name, image and mask file of every case (image or mask may be None)
+    """
+    def volumes(subdirectory):
+        path = os.path.join(directory, subdirectory)
+        if not os.path.isdir(path):
+            return {}
+        return {name.split(os.extsep, 1)[0]: os.path.join(path, name) for name in sorted(os.listdir(path))
+                if name.endswith(('.nii', '.nii.gz'))}
+
+    images, masks = volumes('images'), volumes('labels')
+    cases = []
+    for name, mask in masks.items():
+        image_name = name if name in images else name[:-1] if name.endswith('l') and name[:-1] in images else None
+        cases.append({'name': name, 'image': images.pop(image_name) if image_name else None, 'mask': mask})
+    cases += [{'name': name, 'image': image, 'mask': None} for name, image in images.items()]
+    return cases
+
+
+def read_manifest(file_name):
+    """
+    :param file_name: a CSV file with the columns name, image and mask (image or mask may be empty), paths relative to
+    the manifest
+    :return: list of dicts with the name, image and mask file of every case
+    """
+    directory = os.path.dirname(os.path.abspath(file_name))
+    with open(file_name, newline='') as f:
+        return [{'name': row['name'],
+                 'image': os.path.join(directory, row['image']) if row.get('image') else None,
+                 'mask': os.path.join(directory, row['mask']) if row.get('mask') else None}
+                for row in csv.DictReader(f)]
+
+
+def write_mesh(polydata, file_name):
+    writer = MESH_WRITERS[file_name.rsplit('.', 1)[1]]()
+    writer.SetFileName(file_name)
+    writer.SetInputData(polydata)
+    if hasattr(writer, 'SetFileTypeToBinary'):
+        writer.SetFileTypeToBinary()
+    if not writer.Write():
+        raise IOError("Could not write {}".format(file_name))
+
+
+def export_case(case, output_directory, formats, threshold=None, triangle_budget=SCENE_TRIANGLE_BUDGET):
+    """
+    Runs in a worker process: builds every surface of a case and writes them to output_directory/name.
+    :param case: dict with the name, image and mask file of the case
+    :param formats: mesh file extensions, see MESH_WRITERS
+    :param threshold: the bone threshold, defaults to the middle of the scalar range as in the viewer
+    :param triangle_budget: the triangle budget of the case, None to use MESH_REDUCTION
+    :return: the summary of the case
+    """
+    start = time.perf_counter()
+    summary = {'name': case['name'], 'image': case['image'], 'mask': case['mask'], 'surfaces': []}
+    directory = os.path.join(output_directory, case['name'])
+    os.makedirs(directory, exist_ok=True)
+    try:
+        bone = read_bone(case['image']) if case['image'] else None
+        mask = read_mask(case['mask']) if case['mask'] else None
+        if bone and threshold is not None:
+            bone.labels[0].value = threshold
+        if mask:
+            for label in mask.labels:
+                label.extractor = create_mask_extractor(mask, source=label.voi)
+        if triangle_budget:
+            apply_triangle_budget([nii_object for nii_object in (bone, mask) if nii_object], triangle_budget)
+        summary['read_seconds'] = time.perf_counter() - start
+
+        surfaces = ([(bone, 0, 'bone')] if bone else []) + \
+                   ([(mask, i, 'label_{}'.format(label.value)) for i, label in enumerate(mask.labels)] if mask else [])
+        for nii_object, label_idx, name in surfaces:
+            surface_start = time.perf_counter()
+            label = nii_object.labels[label_idx]
+            if nii_object is bone:
+                crop_to_threshold(bone, label_idx, label.value)
+            set_surface_value(nii_object, label_idx, label.value)
+            polydata = compute_surface(nii_object, label_idx)
+            files = [os.path.join(directory, '{}.{}'.format(name, extension)) for extension in formats]
+            for file_name in files:
+                write_mesh(polydata, file_name)
+            summary['surfaces'].append({'name': name, 'value': label.value, 'triangles': polydata.GetNumberOfCells(),
+                                        'seconds': time.perf_counter() - surface_start, 'files': files})
+    except Exception as e:  # one broken case must not stop the batch
+        summary['error'] = '{}: {}'.format(type(e).__name__, e)
+    summary['seconds'] = time.perf_counter() - start
+    summary['triangles'] = sum(surface['triangles'] for surface in summary['surfaces'])
+    return summary
+
+
+def export_cases(cases, output_directory, formats=('vtp',), workers=MASK_WORKERS, threshold=None,
+                 triangle_budget=SCENE_TRIANGLE_BUDGET, use_cache=False):
+    """
+    Exports every case in a pool of worker processes and writes output_directory/summary.json.
+    :param use_cache: read and write the mesh cache of the viewer
+    :return: the summary
+    """
+    start = time.perf_counter()
+    os.makedirs(output_directory, exist_ok=True)
+    # spawn rather than fork, like poolUtils, VTK and the numpy views of the volumes do not survive a fork cleanly
+    with ProcessPoolExecutor(max(workers, 1), multiprocessing.get_context('spawn'), init_worker, (use_cache,)) as pool:
+        futures = [pool.submit(export_case, case, output_directory, formats, threshold, triangle_budget)
+                   for case in cases]
+        results = []
+        for future in as_completed(futures):
+            results.append(future.result())
+            print("{:<30} {:>8.2f}s {:>10} triangles {}".format(results[-1]['name'], results[-1]['seconds'],
+                                                                 results[-1]['triangles'],
+                                                                 results[-1].get('error', '')))
+
+    results.sort(key=lambda result: result['name'])
+    summary = {'cases': results, 'workers': workers, 'formats': list(formats),
+               'triangle_budget': triangle_budget, 'seconds': time.perf_counter() - start,
+               'failed': [result['name'] for result in results if 'error' in result]}
+    with open(os.path.join(output_directory, 'summary.json'), 'w') as f:
+        json.dump(summary, f, indent=2)
+    return summary
+
+
+def init_worker(use_cache):
+    if not use_cache:
+        vtkUtils.mesh_cache = None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Exports the surfaces of many cases without opening a window.')
+    cases_group = parser.add_mutually_exclusive_group(required=True)
+    cases_group.add_argument('-d', help='a data directory with images/ and labels/ subdirectories')
+    cases_group.add_argument('--manifest', help='a CSV file with the columns name, image and mask')
+    parser.add_argument('-o', required=True, help='the output directory')
+    parser.add_argument('-f', nargs='+', choices=sorted(MESH_WRITERS), default=['vtp'], help='mesh formats')
+    parser.add_argument('-w', type=int, default=MASK_WORKERS, help='number of worker processes')
+    parser.add_argument('-t', type=float, help='bone threshold (default: middle of the scalar range)')
+    parser.add_argument('--budget', type=int, default=SCENE_TRIANGLE_BUDGET,
+                        help='triangle budget per case, 0 to use the fixed decimation')
+    parser.add_argument('--cache', action='store_true', help='read and write the mesh cache of the viewer')
+    args = parser.parse_args()
+
+    cases = find_cases(args.d) if args.d else read_manifest(args.manifest)
+    summary = export_cases(cases, args.o, args.f, args.w, args.t, args.budget or None, args.cache)
+    print("{} cases in {:.1f}s, {} failed".format(len(cases), summary['seconds'], len(summary['failed'])))
@@ -0,0 +1,268 @@
+import argparse
+import multiprocessing
+import resource
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import vtkUtils
+from vtkUtils import *
+
+
+def time_call(func, *args, **kwargs):
+    """
+    :return: the result of func(*args, **kwargs) and the wall time it took in seconds
+    """
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def uncached_setup_mask(file, strategy='auto', workers=1):
+    """
+    Runs setup_mask with an empty surface cache.
+    """
+    vtkUtils.surface_cache = SurfaceCache(SURFACE_CACHE_SIZE)
+    return setup_mask(vtk.vtkRenderer(), file, strategy, workers)
+
+
+def compare_mask_extraction(file, repeats=3):
+    """
+    Times setup_mask with each label extraction strategy.
+    :param file: the mask filename of type 'nii.gz'
+    :param repeats: number of runs per path, the fastest run is reported
+    :return: dict with the best time of each strategy in seconds
+    """
+    timings = {}
+    cache, vtkUtils.mesh_cache = vtkUtils.mesh_cache, None
+    try:
+        for strategy in ('per_label', 'single_pass', 'cropped'):
+            timings[strategy] = min(time_call(uncached_setup_mask, file, strategy)[1] for _ in range(repeats))
+    finally:
+        vtkUtils.mesh_cache = cache
+    return timings
+
+
+def compare_mask_workers(file, workers):
+    """
+    Times setup_mask building the label surfaces in one process against a pool of worker processes.
+    :return: dict with the serial and pool times in seconds
+    """
+    cache, vtkUtils.mesh_cache = vtkUtils.mesh_cache, None
+    try:
+        timings = {}
+        for name, n in (('serial', 1), ('pool', workers)):
+            timings[name] = time_call(uncached_setup_mask, file, 'cropped', n)[1]
+    finally:
+        vtkUtils.mesh_cache = cache
+    return timings
+
+
+def mesh_volume(polydata):
+    mass = vtk.vtkMassProperties()
+    mass.SetInputData(polydata)
+    mass.Update()
+    return mass.GetVolume()
+
+
+def compare_smoothing(file, smoothness=MASK_SMOOTHNESS):
+    """
+    Times every smoothing engine on the largest label of a mask and measures how much it changes the decimated mesh.
+    :return: dict of engine -> {'seconds', 'volume_change' (fraction of the unsmoothed volume), 'mean_displacement'}
+    """
+    reader = read_volume(file)
+    labels = numpy_support.vtk_to_numpy(reader.GetOutput().GetPointData().GetScalars()).astype(np.intp)
+    extractor = vtk.vtkDiscreteMarchingCubes()
+    extractor.SetInputConnection(reader.GetOutputPort())
+    extractor.SetValue(0, int(np.bincount(labels)[1:].argmax()) + 1)
+    reducer = create_polygon_reducer(extractor)
+    reducer.ReleaseDataFlagOff()  # the unsmoothed mesh is compared to the smoothed ones, see MEMORY_LEAN
+    reducer.Update()
+    unsmoothed = reducer.GetOutput()
+
+    results = {}
+    for engine in ('laplacian', 'sinc'):
+        smoother, seconds = time_call(lambda: create_smoother(reducer, smoothness, engine))
+        seconds += time_call(smoother.Update)[1]
+        displacement = (numpy_support.vtk_to_numpy(smoother.GetOutput().GetPoints().GetData()) -
+                        numpy_support.vtk_to_numpy(unsmoothed.GetPoints().GetData()))
+        results[engine] = {'seconds': seconds,
+                           'volume_change': mesh_volume(smoother.GetOutput()) / mesh_volume(unsmoothed) - 1,
+                           'mean_displacement': float(np.linalg.norm(displacement, axis=1).mean())}
+    return results
+
+
+def compare_mesh_cache(bone_file, mask_file):
+    """
+    Times opening a bone/mask pair with an empty mesh cache (cold) and again with the meshes cached (warm).
+    :return: dict with the cold and warm times in seconds
+    """
+    cache = vtkUtils.mesh_cache
+    with tempfile.TemporaryDirectory() as directory:
+        vtkUtils.mesh_cache = MeshCache(directory, MESH_CACHE_SIZE)
+        try:
+            timings = {}
+            for name in ('cold', 'warm'):
+                vtkUtils.surface_cache = SurfaceCache(SURFACE_CACHE_SIZE)
+                renderer = vtk.vtkRenderer()
+                timings[name] = time_call(lambda: (setup_bone(renderer, bone_file), setup_mask(renderer, mask_file)))[1]
+        finally:
+            vtkUtils.mesh_cache = cache
+    return timings
+
+
+def measure_volume_reading(file, fast):
+    """
+    Runs in a fresh process: reads a volume and touches every voxel, as setting up a mask does.
+    :return: the wall time in seconds and the growth of the peak resident memory in bytes
+    """
+    vtkUtils.FAST_NIFTI_READER = fast
+    start_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    reader, seconds = time_call(read_volume, file)
+    scalars = numpy_support.vtk_to_numpy(reader.GetOutput().GetPointData().GetScalars())
+    seconds += time_call(scalars.max)[1]
+    return seconds, (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - start_rss) * 1024  # reported in kibibytes
+
+
+def compare_volume_reading(file):
+    """
+    Times vtkNIFTIImageReader against niftiUtils on a volume, each in its own process so the peak memory is its own.
+    :return: dict of reader -> (seconds, peak memory growth in bytes)
+    """
+    results = {}
+    for name, fast in (('vtk', False), ('niftiUtils', True)):
+        with ProcessPoolExecutor(1, multiprocessing.get_context('spawn')) as pool:
+            results[name] = pool.submit(measure_volume_reading, file, fast).result()
+    return results
+
+
+def measure_surface_extraction(file, threshold, memory_budget):
+    """
+    Runs in a fresh process: extracts the threshold surface of a volume in one piece, or streamed in slabs when a
+    memory budget is given.
+    :return: the wall time in seconds, the growth of the peak resident memory in bytes and the number of triangles
+    """
+    start_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if memory_budget:
+        (polydata, stats), seconds = time_call(stream_surface, file, threshold, BONE_SMOOTHNESS,
+                                               memory_budget=memory_budget)
+    else:
+        def extract():
+            reader = read_volume(file)
+            extractor = vtk.vtkFlyingEdges3D()
+            extractor.SetInputConnection(reader.GetOutputPort())
+            extractor.SetValue(0, threshold)
+            return create_surface_polydata(extractor, BONE_SMOOTHNESS)
+        polydata, seconds = time_call(extract)
+    peak = (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - start_rss) * 1024  # reported in kibibytes
+    return seconds, peak, polydata.GetNumberOfCells()
+
+
+def compare_streaming(file, threshold, memory_budget=STREAM_MEMORY_BUDGET):
+    """
+    Compares extracting the surface of a volume in one piece against streaming it in slabs (see stream_surface), each
+    in its own process so the peak memory is its own.
+    :return: dict of mode -> (seconds, peak memory growth in bytes, triangles)
+    """
+    results = {}
+    for name, budget in (('whole', None), ('streamed', memory_budget)):
+        with ProcessPoolExecutor(1, multiprocessing.get_context('spawn')) as pool:
+            results[name] = pool.submit(measure_surface_extraction, file, threshold, budget).result()
+    return results
+
+
+def change_scene_smoothness(bone, mask, step):
+    """
+    Recomputes the bone surface and the built mask surfaces with their smoothness raised by step.
+    :return: the wall time it took in seconds
+    """
+    bone_label = bone.labels[0]
+    built = [i for i, label in enumerate(mask.labels) if label.surface is not None]
+    start = time.perf_counter()
+    compute_bone_surface(bone, bone_label.value, bone_label.smoothness + step)
+    compute_label_surfaces(mask, built, mask.labels[built[0]].smoothness + step if built else MASK_SMOOTHNESS)
+    return time.perf_counter() - start
+
+
+def measure_scene_memory(bone_file, mask_file, lean):
+    """
+    Runs in a fresh process: builds the scene of a bone/mask pair without the mesh cache, with or without MEMORY_LEAN,
+    then changes the smoothness of its surfaces twice.
+    :return: the resident memory in bytes held after the volumes are read and after the scene is built, the growth
+    of the peak resident memory while building it, and the wall times of the two smoothness changes in seconds
+    """
+    vtkUtils.MEMORY_LEAN = lean
+    vtkUtils.mesh_cache = None
+    renderer = vtk.vtkRenderer()
+    start = current_rss()
+    bone, mask = read_bone(bone_file), read_mask(mask_file)
+    read = current_rss()
+    start_peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    apply_triangle_budget([bone, mask], SCENE_TRIANGLE_BUDGET)
+    build_bone(renderer, bone)
+    build_mask(renderer, mask)
+    peak = (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - start_peak) * 1024  # reported in kibibytes
+    built = current_rss() - start
+    # the first change may extract surfaces built in worker processes, the second only runs the smoothers
+    changes = tuple(change_scene_smoothness(bone, mask, 50) for _ in range(2))
+    return (read - start, built, peak) + changes
+
+
+def compare_memory_lean(bone_file, mask_file):
+    """
+    Compares the memory a scene holds with and without MEMORY_LEAN, each in its own process.
+    :return: dict of mode -> (bytes after reading, bytes after building, peak growth while building in bytes,
+    seconds of the first and second smoothness change)
+    """
+    results = {}
+    for name, lean in (('full', False), ('lean', True)):
+        with ProcessPoolExecutor(1, multiprocessing.get_context('spawn')) as pool:
+            results[name] = pool.submit(measure_scene_memory, bone_file, mask_file, lean).result()
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Times the stages of the visualizer pipeline.')
+    parser.add_argument('-i', help='an mri scan (nii or nii.gz)')
+    parser.add_argument('-m', help='the segmentation mask (nii or nii.gz)', required=True)
+    parser.add_argument('-r', type=int, default=3, help='number of repeats per measurement')
+    parser.add_argument('-w', type=int, default=MASK_WORKERS, help='number of worker processes')
+    parser.add_argument('-s', type=float, help='stream the surface of the scan at this threshold and compare')
+    parser.add_argument('-b', type=int, default=STREAM_MEMORY_BUDGET, help='memory budget of the streamed surface')
+    args = parser.parse_args()
+
+    for file in filter(None, (args.i, args.m)):
+        read_timings = compare_volume_reading(file)
+        for name, (seconds, peak) in read_timings.items():
+            print("read {:<18} {:.3f}s ({:.2f}x), peak memory +{:.0f} MB".format(
+                name, seconds, read_timings['vtk'][0] / seconds, peak / 1024 ** 2))
+
+    if args.i and args.s is not None:
+        for mode, (seconds, peak, triangles) in compare_streaming(args.i, args.s, args.b).items():
+            print("surface {:<15} {:.3f}s, peak memory +{:.0f} MB, {} triangles".format(
+                mode, seconds, peak / 1024 ** 2, triangles))
+
+    mask_timings = compare_mask_extraction(args.m, args.r)
+    for strategy, seconds in mask_timings.items():
+        print("setup_mask {:<12} {:.3f}s ({:.2f}x)".format(strategy, seconds, mask_timings['per_label'] / seconds))
+
+    worker_timings = compare_mask_workers(args.m, args.w)
+    print("setup_mask {} workers   {:.3f}s ({:.2f}x)".format(args.w, worker_timings['pool'],
+                                                          worker_timings['serial'] / worker_timings['pool']))
+
+    for engine, result in compare_smoothing(args.m).items():
+        print("smoothing {:<10} {:.3f}s, volume {:+.2%}, mean displacement {:.3f}".format(
+            engine, result['seconds'], result['volume_change'], result['mean_displacement']))
+
+    if args.i:
+        for mode, (read, built, peak, first, second) in compare_memory_lean(args.i, args.m).items():
+            print("scene memory {:<10} volumes {:.0f} MB, scene {:.0f} MB, peak while building +{:.0f} MB, "
+                  "smoothness change {:.3f}s then {:.3f}s".format(mode, read / 1024 ** 2, built / 1024 ** 2,
+                                                                   peak / 1024 ** 2, first, second))
+
+        cache_timings = compare_mesh_cache(args.i, args.m)
+        print("open cold mesh cache    {:.3f}s".format(cache_timings['cold']))
+        print("open warm mesh cache    {:.3f}s ({:.2f}x)".format(cache_timings['warm'],
+                                                              cache_timings['cold'] / cache_timings['warm']))
@@ -0,0 +1,255 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+
+import vtkUtils
+from benchmark import time_call
+from vtkUtils import *
+
+'''
+Times every stage of the vtkUtils pipeline on generated label volumes, so performance can be compared across commits:
+
+    python benchmark_suite.py -o before.json
+    python benchmark_suite.py -o after.json
+    python benchmark_suite.py --compare before.json after.json
+
+Each case is a label volume (spheres, nested shells or thin tubes) of a given size and label count, written as a
+mask and, with the labels turned into intensities, as a bone scan. The 'startup' case times the imports and the first
+offscreen frame of the first case in a fresh process, see measure_startup.
+'''
+
+STARTUP_SCRIPT = '''
+import json, sys, time
+start = time.perf_counter()
+import vtkUtils
+from vtkUtils import *
+imported = time.perf_counter()
+import MainWindow
+ui_imported = time.perf_counter()
+vtkUtils.mesh_cache = None
+render_window = vtk.vtkRenderWindow()
+render_window.SetOffScreenRendering(1)
+renderer = vtk.vtkRenderer()
+render_window.AddRenderer(renderer)
+setup_scene(renderer, sys.argv[1], sys.argv[2])
+set_axial_camera(renderer)
+render_window.Render()
+print(json.dumps({'import_vtkUtils': imported - start, 'import_MainWindow': ui_imported - imported,
+                  'first_frame': time.perf_counter() - start}))
+'''
+SHAPES = ('spheres', 'shells', 'tubes')
+QUICK_CASES = [(shape, 64, 8) for shape in SHAPES] + [('spheres', 128, 32)]
+FULL_CASES = [(shape, size, labels) for shape in SHAPES for size in (64, 128, 256) for labels in (4, 32, 128)]
+
+
+def make_spheres(size, labels, seed=0):
+    """
+    :return: a [z, y, x] uint16 volume with one randomly placed sphere per label
+    """
+    rng = np.random.default_rng(seed)
+    z, y, x = np.ogrid[:size, :size, :size]
+    array = np.zeros((size,) * 3, np.uint16)
+    for value in range(1, labels + 1):
+        radius = rng.uniform(0.03, 0.12) * size
+        cz, cy, cx = rng.uniform(radius, size - radius, 3)
+        array[(x - cx) ** 2 + (y - cy) ** 2 + (z - cz) ** 2 < radius ** 2] = value
+    return array
+
+
+def make_shells(size, labels, seed=0):
+    """
+    :return: a [z, y, x] uint16 volume of nested spherical shells around the center, one label per shell
+    """
+    z, y, x = np.ogrid[:size, :size, :size]
+    distance = np.sqrt((x - size / 2) ** 2 + (y - size / 2) ** 2 + (z - size / 2) ** 2)
+    shell = np.floor(distance / (0.45 * size) * labels).astype(np.int64) + 1
+    return np.where(shell <= labels, shell, 0).astype(np.uint16)
+
+
+def make_tubes(size, labels, seed=0):
+    """
+    :return: a [z, y, x] uint16 volume of thin straight tubes along random directions, one label per tube
+    """
+    rng = np.random.default_rng(seed)
+    points = np.stack(np.meshgrid(*(np.arange(size),) * 3, indexing='ij'), axis=-1).astype(np.float32)
+    array = np.zeros((size,) * 3, np.uint16)
+    for value in range(1, labels + 1):
+        start, direction = rng.uniform(0, size, 3), rng.normal(size=3)
+        direction /= np.linalg.norm(direction)
+        offset = points - start
+        distance = np.linalg.norm(offset - (offset @ direction)[..., None] * direction, axis=-1)
+        array[distance < max(1.5, 0.01 * size)] = value
+    return array
+
+
+def write_nifti(array, file_name):
+    """
+    Writes a [z, y, x] volume with unit spacing.
+    """
+    image = vtk.vtkImageData()
+    image.SetDimensions(array.shape[2], array.shape[1], array.shape[0])
+    image.GetPointData().SetScalars(numpy_support.numpy_to_vtk(
+        np.ascontiguousarray(array).ravel(), deep=True, array_type=numpy_support.get_vtk_array_type(array.dtype)))
+    writer = vtk.vtkNIFTIImageWriter()
+    writer.SetFileName(file_name)
+    writer.SetInputData(image)
+    writer.Write()
+
+
+def make_case(shape, size, labels, directory):
+    """
+    Writes the mask and bone scan of a case.
+    :return: the bone and mask file names
+    """
+    array = globals()['make_' + shape](size, labels)
+    mask_file = os.path.join(directory, '{}_{}_{}_mask.nii.gz'.format(shape, size, labels))
+    bone_file = os.path.join(directory, '{}_{}_{}_bone.nii.gz'.format(shape, size, labels))
+    write_nifti(array, mask_file)
+    rng = np.random.default_rng(0)
+    write_nifti((np.where(array > 0, 1000, 0) + rng.normal(0, 50, array.shape)).astype(np.int16), bone_file)
+    return bone_file, mask_file
+
+
+def time_stages(bone_file, mask_file, repeats=3):
+    """
+    Times every pipeline stage on its own (the stages before it are already up to date), the first offscreen frame of
+    the bone surface (first_render) and setup_bone / setup_mask end to end, without the mesh cache.
+    :return: dict of stage -> the fastest time in seconds, and the number of triangles of the bone surface
+    """
+    def best(func):
+        return min(time_call(func)[1] for _ in range(repeats))
+
+    timings = {}
+    cache, vtkUtils.mesh_cache = vtkUtils.mesh_cache, None
+    try:
+        timings['read_volume'] = best(lambda: read_volume(bone_file))
+        bone, mask = read_volume(bone_file), read_volume(mask_file)
+        threshold = sum(bone.GetOutput().GetScalarRange()) / 2
+
+        extractor = vtk.vtkFlyingEdges3D()
+        extractor.SetInputConnection(bone.GetOutputPort())
+        extractor.SetValue(0, threshold)
+        timings['flying_edges'] = best(lambda: (extractor.Modified(), extractor.Update()))
+
+        labels = vtk.vtkDiscreteMarchingCubes()
+        labels.SetInputConnection(mask.GetOutputPort())
+        labels.GenerateValues(int(mask.GetOutput().GetScalarRange()[1]), 1, mask.GetOutput().GetScalarRange()[1])
+        timings['discrete_marching_cubes'] = best(lambda: (labels.Modified(), labels.Update()))
+
+        reducer = create_polygon_reducer(extractor)
+        reducer.ReleaseDataFlagOff()  # each stage is timed with the outputs before it up to date, see MEMORY_LEAN
+        timings['create_polygon_reducer'] = best(lambda: (reducer.Modified(), reducer.Update()))
+        smoother = create_smoother(reducer, BONE_SMOOTHNESS)
+        smoother.ReleaseDataFlagOff()
+        timings['create_smoother'] = best(lambda: (smoother.Modified(), smoother.Update()))
+        normals = create_normals(smoother)
+        timings['create_normals'] = best(lambda: (normals.Modified(), normals.Update()))
+
+        def first_render():  # a new offscreen window each time, so the shaders and buffers are set up again
+            render_window = vtk.vtkRenderWindow()
+            render_window.SetOffScreenRendering(1)
+            renderer = vtk.vtkRenderer()
+            render_window.AddRenderer(renderer)
+            renderer.AddActor(create_actor(create_mapper(normals.GetOutput()),
+                                           create_property(BONE_OPACITY, BONE_COLORS[0])))
+            render_window.Render()
+        timings['first_render'] = best(first_render)
+
+        def setup(function, file):
+            vtkUtils.surface_cache = SurfaceCache(SURFACE_CACHE_SIZE)
+            return function(vtk.vtkRenderer(), file)
+        timings['setup_bone'] = best(lambda: setup(setup_bone, bone_file))
+        timings['setup_mask'] = best(lambda: setup(setup_mask, mask_file))
+        return timings, normals.GetOutput().GetNumberOfCells()
+    finally:
+        vtkUtils.mesh_cache = cache
+
+
+def measure_startup(bone_file, mask_file, repeats=3):
+    """
+    Runs STARTUP_SCRIPT in fresh processes: the time to import vtkUtils, then MainWindow, and from the start of the
+    process to the first offscreen frame of the scene.
+    :return: dict of stage -> the fastest time in seconds
+    """
+    runs = [json.loads(subprocess.check_output(
+        [sys.executable, '-c', STARTUP_SCRIPT, bone_file, mask_file], stderr=subprocess.DEVNULL,
+        cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip().splitlines()[-1]) for _ in range(repeats)]
+    return {stage: min(run[stage] for run in runs) for stage in runs[0]}
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_suite(cases, repeats=3):
+    """
+    :param cases: list of (shape, size, labels)
+    :return: the results, ready to be written as JSON
+    """
+    results = {'commit': git_commit(), 'python': platform.python_version(), 'vtk': vtk.vtkVersion.GetVTKVersion(),
+               'numpy': np.__version__, 'cpus': os.cpu_count(), 'repeats': repeats, 'cases': {}}
+    with tempfile.TemporaryDirectory() as directory:
+        timings = measure_startup(*make_case(*cases[0], directory), repeats)
+        results['cases']['startup'] = {'seconds': timings}
+        print("{:<20} ".format('startup') + " ".join("{}={:.3f}".format(stage, seconds)
+                                                     for stage, seconds in timings.items()))
+        for shape, size, labels in cases:
+            name = '{}_{}_{}'.format(shape, size, labels)
+            timings, triangles = time_stages(*make_case(shape, size, labels, directory), repeats)
+            results['cases'][name] = {'shape': shape, 'size': size, 'labels': labels, 'triangles': triangles,
+                                      'seconds': timings}
+            print("{:<20} ".format(name) + " ".join("{}={:.3f}".format(stage, seconds)
+                                                    for stage, seconds in timings.items()))
+    return results
+
+
+def compare_results(before, after, tolerance=0.1):
+    """
+    :param before: results of run_suite on the base commit
+    :param after: results of run_suite on the new commit
+    :param tolerance: slowdown fraction above which a stage counts as a regression
+    :return: list of (case, stage, before seconds, after seconds, ratio) of every stage measured in both, and the
+    list of regressions among them
+    """
+    rows = []
+    for case, result in after['cases'].items():
+        if case not in before['cases']:
+            continue
+        for stage, seconds in result['seconds'].items():
+            base = before['cases'][case]['seconds'].get(stage)
+            if base:
+                rows.append((case, stage, base, seconds, seconds / base))
+    return rows, [row for row in rows if row[4] > 1 + tolerance]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Times the vtkUtils pipeline stages on generated volumes.')
+    parser.add_argument('-o', help='write the results to this JSON file')
+    parser.add_argument('-r', type=int, default=3, help='number of repeats per stage, the fastest is kept')
+    parser.add_argument('--full', action='store_true', help='run every shape, size and label count')
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'), help='compare two result files')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='slowdown counted as a regression')
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0]) as before_file, open(args.compare[1]) as after_file:
+            rows, regressions = compare_results(json.load(before_file), json.load(after_file), args.tolerance)
+        for case, stage, base, seconds, ratio in rows:
+            print("{:<20} {:<24} {:>8.3f}s -> {:>8.3f}s {:>6.2f}x{}".format(
+                case, stage, base, seconds, ratio, '  REGRESSION' if ratio > 1 + args.tolerance else ''))
+        sys.exit(1 if regressions else 0)
+
+    results = run_suite(FULL_CASES if args.full else QUICK_CASES, args.r)
+    if args.o:
+        with open(args.o, 'w') as f:
+            json.dump(results, f, indent=2)
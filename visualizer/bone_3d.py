@@ -1,9 +1,16 @@
+import time
+START_TIME = time.perf_counter()  # before the imports, startup is measured from here (see MainWindow.report_startup)
+
 import argparse
+import multiprocessing
 import sys
 import os
 
+import vtkUtils
 from MainWindow import *
 
+IMPORT_SECONDS = time.perf_counter() - START_TIME
+
 
 def redirect_vtk_messages():
     """ Redirect VTK related error messages to a file."""
@@ -18,17 +25,30 @@ def redirect_vtk_messages():
 
 def verify_type(file):
     ext = os.path.basename(file).split(os.extsep, 1)
-    if ext[1] != 'nii.gz':
-        parser.error("File doesn't end with 'nii.gz'. Found: {}".format(ext[1]))
+    if len(ext) < 2 or ext[1] not in ('nii', 'nii.gz'):
+        parser.error("File doesn't end with 'nii' or 'nii.gz'. Found: {}".format(ext[-1]))
     return file
 
 
 if __name__ == "__main__":
-    parser = argparse.ArgumentParser(description='Reads Nii.gz Files and renders them in 3D.')
-    parser.add_argument('-i', type=lambda fn: verify_type(fn), help='an mri scan (nii.gz)')
-    parser.add_argument('-m', type=lambda fn: verify_type(fn), help='the segmentation mask (nii.gz)')
+    multiprocessing.freeze_support()  # in the frozen builds, the mask worker processes start here
+    parser = argparse.ArgumentParser(description='Reads Nii and Nii.gz Files and renders them in 3D.')
+    parser.add_argument('-i', type=lambda fn: verify_type(fn), help='an mri scan (nii or nii.gz)')
+    parser.add_argument('-m', type=lambda fn: verify_type(fn), help='the segmentation mask (nii or nii.gz)')
+    parser.add_argument('--no-cache', action='store_true', help='do not read or write the mesh cache')
+    parser.add_argument('--volume-cache', action='store_true', default=VOLUME_CACHE_ENABLED,
+                        help='keep decoded volumes in a local cache that opens faster than nii.gz')
+    parser.add_argument('--smoothing', choices=['sinc', 'laplacian'], default=SMOOTHING_ENGINE,
+                        help='the smoothing engine (default: %(default)s)')
     args = parser.parse_args()
 
+    vtkUtils.SMOOTHING_ENGINE = args.smoothing
+
+    if args.no_cache:
+        vtkUtils.mesh_cache = None
+    if args.volume_cache and not vtkUtils.volume_cache:
+        vtkUtils.volume_cache = VolumeCache(VOLUME_CACHE_DIR, VOLUME_CACHE_SIZE)
+
     redirect_vtk_messages()
     app = QtWidgets.QApplication(sys.argv)
 
@@ -38,5 +58,7 @@ if __name__ == "__main__":
 
     app.BONE_FILE = args.i
     app.MASK_FILE = args.m
+    app.START_TIME = START_TIME
+    app.IMPORT_SECONDS = IMPORT_SECONDS
     window = MainWindow(app)
     sys.exit(app.exec_())
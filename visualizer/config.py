@@ -1,8 +1,31 @@
+import os
+
+# volume reading
+FAST_NIFTI_READER = True  # read volumes with niftiUtils (memory-mapped .nii, one pass .nii.gz) when possible
+NIFTI_GZIP_THREADS = 2  # threads of the optional isal gzip reader, reading and decompressing overlap
+VOLUME_CACHE_ENABLED = False  # keep decoded volumes as memory-mappable .npy files, see VolumeCache
+VOLUME_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.theia', 'volume_cache')
+VOLUME_CACHE_SIZE = 8 * 1024 ** 3  # bytes, least recently used volumes are evicted above this size
+
+# sessions
+CASE_POOL_SIZE = 4 * 1024 ** 3  # bytes of volumes and meshes of the open cases, see VolumePool
+
 # default brain settings
 APPLICATION_TITLE = "Theia – NIfTI (nii.gz) 3D Visualizer"
-BONE_SMOOTHNESS = 500
+BONE_SMOOTHNESS = 500  # smoothness spin box value, see vtkUtils.create_smoother for its effect per engine
 BONE_OPACITY = 0.2
 BONE_COLORS = [(1.0, 0.9, 0.9)]  # RGB percentages
+PROGRESSIVE_PREVIEW = True  # show coarse bone surfaces while the full resolution surface is computed
+PREVIEW_FACTORS = (8, 4, 2)  # subsampling factors of the preview stages, the finished surface follows the last one
+PREVIEW_LATENCY = 0.1  # seconds, time budget of the first preview stage
+PREVIEW_INITIAL_RATE = 50e6  # voxels per second, extraction rate assumed until a preview was measured
+PREFETCH_RADIUS = 2  # threshold steps on each side of the current threshold computed while idle
+PREFETCH_DELAY = 300  # milliseconds without threshold changes before prefetching starts
+SLICE_FRAME_INTERVAL = 16  # milliseconds, slider events within one frame are shown together
+SLICE_PREFETCH_RADIUS = 4  # slices on each side of the shown slice extracted while the slider is idle
+SLICE_CACHE_SIZE = 256  # extracted slices kept in memory
+VOLUME_THREADS = os.cpu_count() or 1  # threads of the ray cast volume rendering
+VOLUME_OPACITY_RAMP = 0.02  # fraction of the scalar range over which the volume fades in above the threshold
 
 # default mask settings
 MASK_SMOOTHNESS = 500
@@ -14,5 +37,36 @@ MASK_COLORS = [(1, 0, 0),
                 (0, 1, 1),
                 (1, 0.5, 0.5),
                 (0.5, 1, 0.5),
-                (0.5, 0.5, 1)]  # RGB percentages
+                (0.5, 0.5, 1)]  # RGB percentages, extended by vtkUtils.create_label_colors for more labels
 MASK_OPACITY = 1.0
+MASK_EAGER_LABELS = 10  # labels extracted at startup, the others are extracted when first shown
+MASK_WORKERS = os.cpu_count() or 1  # processes building the label surfaces at startup
+MASK_POOL_MIN_LABELS = 4  # fewer labels to build are built in process, starting the workers takes a moment
+
+# diagnostics
+PIPELINE_DIAGNOSTICS = True  # record the time, output size and memory of every filter execution, see PipelineObserver
+PIPELINE_DIAGNOSTICS_SIZE = 20000  # filter executions kept, the oldest are dropped
+
+# label statistics
+STATISTICS_SLAB_VOXELS = 16 * 1024 ** 2  # voxels swept at a time by statisticsUtils, bounds its temporary memory
+
+# thumbnail settings
+THUMBNAIL_SIZE = 256  # pixels, width and height of the thumbnails, see thumbnails.py
+
+# mesh settings
+MESH_REDUCTION = 0.5  # fraction of the triangles removed by decimation when there is no triangle budget
+SCENE_TRIANGLE_BUDGET = 2000000  # triangles shared by all surfaces of the scene, see vtkUtils.allocate_triangles
+TARGET_FRAME_RATE = 30  # frames per second the triangle budget is tuned towards
+BUDGET_SAMPLE_FRAMES = 5  # frames averaged to tune the triangle budget, after a first frame that compiles the shaders
+LOD_DIVISIONS = 32  # clustering cells along each axis of the low resolution meshes drawn while the camera moves
+INTERACTIVE_UPDATE_RATE = 15  # frames per second requested while the camera moves, low resolution meshes keep it
+STREAM_MEMORY_BUDGET = 1024 ** 3  # bytes, slab size of the streamed extraction, see vtkUtils.stream_surface
+STREAM_MEMORY_FACTOR = 8  # bytes the extraction of a slab uses per byte of the slab
+MEMORY_LEAN = True  # free the intermediate outputs of the surface pipelines once their meshes are built
+SMOOTHING_ENGINE = 'sinc'  # 'sinc' (windowed sinc) or 'laplacian', see vtkUtils.create_smoother
+SINC_ITERATIONS = 20  # windowed sinc filter degree, the smoothness spin box sets its pass band
+SMOOTHING_CONVERGENCE = 1e-4  # laplacian stops once points move less than this fraction of the mesh size
+MESH_CACHE_ENABLED = True
+MESH_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.theia', 'mesh_cache')
+MESH_CACHE_SIZE = 2 * 1024 ** 3  # bytes, least recently used meshes are evicted above this size
+SURFACE_CACHE_SIZE = 512 * 1024 ** 2  # bytes of meshes kept in memory
@@ -0,0 +1,189 @@
+import gzip
+import struct
+
+import numpy as np
+import vtkModules as vtk
+from vtkModules import numpy_support
+
+from config import *
+
+try:
+    from isal import igzip_threaded  # optional, decompresses gzip several times faster than zlib, off the GIL
+except ImportError:
+    igzip_threaded = None
+
+'''
+Reads NIfTI-1 volumes straight into numpy arrays and hands them to VTK without another copy:
+
+    .nii        memory-mapped, pages are read from disk when the pipeline first touches them
+    .nii.gz     decompressed in one pass directly into the volume array
+
+Volumes this module does not handle (NIfTI-2, .hdr/.img pairs, big endian, 4D, complex or RGB data) return None
+from read_nifti, and vtkUtils.read_volume falls back to vtkNIFTIImageReader.
+'''
+
+NIFTI_HEADER_SIZE = 348
+NIFTI_DTYPES = {2: np.uint8, 4: np.int16, 8: np.int32, 16: np.float32, 64: np.float64, 256: np.int8,
+                512: np.uint16, 768: np.uint32, 1024: np.int64, 1280: np.uint64}
+
+
+def parse_nifti_header(data):
+    """
+    :param data: the first NIFTI_HEADER_SIZE bytes of the file
+    :return: dict with the shape ([z, y, x]), dtype, spacing, vox_offset and whether the slices are stored reversed
+    (flip_slices), or None if the volume is not a little endian 3D NIfTI-1 volume of a supported type
+    """
+    if len(data) < NIFTI_HEADER_SIZE or struct.unpack_from('<i', data, 0)[0] != NIFTI_HEADER_SIZE:
+        return None  # NIfTI-2 or big endian
+    if data[344:348] not in (b'n+1\0', b'ni1\0'):
+        return None
+    dim = struct.unpack_from('<8h', data, 40)
+    datatype = struct.unpack_from('<h', data, 70)[0]
+    pixdim = struct.unpack_from('<8f', data, 76)
+    vox_offset = struct.unpack_from('<f', data, 108)[0]
+    if not 1 <= dim[0] <= 7 or any(d > 1 for d in dim[4:dim[0] + 1]) or datatype not in NIFTI_DTYPES:
+        return None
+    shape = [max(d, 1) if i <= dim[0] else 1 for i, d in enumerate(dim[1:4], 1)]
+    return {'shape': tuple(reversed(shape)), 'dtype': np.dtype(NIFTI_DTYPES[datatype]).newbyteorder('<'),
+            'spacing': tuple(p if i <= dim[0] else 1.0 for i, p in enumerate(pixdim[1:4], 1)),
+            'vox_offset': int(vox_offset),
+            # like vtkNIFTIImageReader, a negative qfac flips the slice order whatever the qform_code
+            'flip_slices': pixdim[0] < 0}
+
+
+def flip_slices(array):
+    """
+    Reverses the slices of a [z, y, x] array in place, one slice at a time.
+    """
+    for z in range(len(array) // 2):
+        array[[z, -z - 1]] = array[[-z - 1, z]]
+
+
+def open_gzip(file_name):
+    if igzip_threaded is not None:
+        return igzip_threaded.open(file_name, 'rb', threads=NIFTI_GZIP_THREADS)
+    return gzip.open(file_name, 'rb')
+
+
+def read_exactly(stream, buffer):
+    """
+    Fills a writable buffer from a stream.
+    :return: False if the stream ended first
+    """
+    view = memoryview(buffer).cast('B')
+    while view.nbytes:
+        read = stream.readinto(view)
+        if not read:
+            return False
+        view = view[read:]
+    return True
+
+
+def load_nifti_array(file_name):
+    """
+    :param file_name: a '.nii' or '.nii.gz' file
+    :return: the [z, y, x] volume (a memory map for '.nii' files) and its parsed header, or None, None
+    """
+    if file_name.endswith('.gz'):
+        with open_gzip(file_name) as stream:
+            header = parse_nifti_header(stream.read(NIFTI_HEADER_SIZE))
+            if header is None or header['vox_offset'] < NIFTI_HEADER_SIZE:
+                return None, None
+            stream.read(header['vox_offset'] - NIFTI_HEADER_SIZE)  # extensions
+            array = np.empty(header['shape'], header['dtype'])
+            if not read_exactly(stream, array):
+                return None, None
+    else:
+        with open(file_name, 'rb') as f:
+            header = parse_nifti_header(f.read(NIFTI_HEADER_SIZE))
+        if header is None or header['vox_offset'] < NIFTI_HEADER_SIZE:
+            return None, None
+        # copy on write, so flipping the slices does not write back to the file
+        array = np.memmap(file_name, header['dtype'], 'c', header['vox_offset'], header['shape'])
+    if header['flip_slices']:
+        flip_slices(array)
+    return array, header
+
+
+def open_nifti(file_name):
+    """
+    :return: a stream of the file positioned at the first voxel and the parsed header, or None, None if the volume is
+    not supported (see parse_nifti_header)
+    """
+    stream = open_gzip(file_name) if file_name.endswith('.gz') else open(file_name, 'rb')
+    header = parse_nifti_header(stream.read(NIFTI_HEADER_SIZE))
+    if header is None or header['vox_offset'] < NIFTI_HEADER_SIZE:
+        stream.close()
+        return None, None
+    stream.read(header['vox_offset'] - NIFTI_HEADER_SIZE)  # extensions
+    return stream, header
+
+
+def iter_nifti_slabs(stream, header, depth):
+    """
+    Reads a volume from open_nifti as slabs of depth slices, so only one slab is in memory at a time. Consecutive
+    slabs share one slice, so every cell of the volume lies in exactly one slab.
+    :param depth: number of new slices per slab, at least 2 so that every slab (the first one has no shared slice)
+    holds at least one layer of cells
+    :return: generator of (z0, slab), the [z, y, x] slab starting at slice z0 of the volume (in VTK slice order)
+    """
+    if depth < 2:
+        raise ValueError("Slabs of {} slice(s) hold no cells, at least 2 slices are needed".format(depth))
+    depth_total, slice_shape = header['shape'][0], header['shape'][1:]
+    previous = None
+    read = 0
+    while read < depth_total:
+        count = min(depth, depth_total - read)
+        slab = np.empty((count + (previous is not None),) + slice_shape, header['dtype'])
+        if previous is not None:
+            slab[0] = previous
+        if not read_exactly(stream, slab[previous is not None:]):
+            raise EOFError("{} slices expected, the volume ended after {}".format(depth_total, read))
+        first_slice = read - (previous is not None)
+        read += count
+        previous = slab[-1].copy()
+        if header['flip_slices']:  # the file stores the slices from the last to the first
+            yield depth_total - 1 - (first_slice + len(slab) - 1), np.ascontiguousarray(slab[::-1])
+        else:
+            yield first_slice, slab
+
+
+def create_image_import(array, spacing, origin=(0.0, 0.0, 0.0)):
+    """
+    Wraps a contiguous [z, y, x] numpy volume in a VTK image source without copying it. The source and its output
+    scalars keep the array alive, see keep_alive.
+    (https://www.vtk.org/doc/nightly/html/classvtkImageImport.html)
+    :return: the updated vtkImageImport
+    """
+    importer = vtk.vtkImageImport()
+    importer.SetDataScalarType(numpy_support.get_vtk_array_type(array.dtype))
+    importer.SetNumberOfScalarComponents(1)
+    importer.SetWholeExtent(0, array.shape[2] - 1, 0, array.shape[1] - 1, 0, array.shape[0] - 1)
+    importer.SetDataExtentToWholeExtent()
+    importer.SetDataSpacing(spacing)
+    importer.SetDataOrigin(origin)
+    importer.SetImportVoidPointer(array, 1)
+    importer.Update()
+    keep_alive(importer, array)
+    keep_alive(importer.GetOutput().GetPointData().GetScalars(), array)
+    return importer
+
+
+def keep_alive(vtk_object, obj):
+    """
+    Keeps obj alive for as long as the VTK object exists, even after its Python wrapper is gone (e.g. a source that is
+    only referenced by the pipeline it feeds). The observer holding obj is released when the VTK object is deleted.
+    """
+    vtk_object.AddObserver('DeleteEvent', lambda caller, event, obj=obj: None)
+
+
+def read_nifti(file_name):
+    """
+    :param file_name: a '.nii' or '.nii.gz' file
+    :return: a vtkImageImport producing the volume, with the same extent, spacing and origin as vtkNIFTIImageReader,
+    or None if the volume is not supported by this module
+    """
+    array, header = load_nifti_array(file_name)
+    if array is None:
+        return None
+    return create_image_import(array, header['spacing'])
@@ -0,0 +1,131 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import vtkModules as vtk
+from vtkModules import numpy_support
+from niftiUtils import keep_alive
+
+'''
+Runs the per-label surface pipeline of vtkUtils in worker processes:
+
+    main process:   label volume -> shared memory
+    worker:         shared memory -> label VOI -> extractor -> decimate -> smoother -> normals -> packed arrays
+    main process:   packed arrays -> vtkPolyData -> actor
+
+The label volume is copied once into shared memory and mapped by every worker, and the finished meshes are sent
+back as flat numpy arrays instead of pickled VTK objects.
+'''
+
+_volume = None  # the label volume of the worker process, set by _init_worker
+
+
+def share_volume(array):
+    """
+    Copies a volume into shared memory.
+    :param array: the [z, y, x] numpy volume
+    :return: the SharedMemory (close and unlink it when done) and a picklable descriptor for _init_worker
+    """
+    memory = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    np.ndarray(array.shape, array.dtype, buffer=memory.buf)[:] = array
+    return memory, (memory.name, array.shape, array.dtype.str)
+
+
+def _init_worker(descriptor, image_info):
+    global _volume
+    name, shape, dtype = descriptor
+    memory = shared_memory.SharedMemory(name=name)
+    _volume = (memory, np.ndarray(shape, np.dtype(dtype), buffer=memory.buf), image_info)
+
+
+def create_worker_pool(array, image, workers):
+    """
+    :param array: the [z, y, x] label volume shared with the workers
+    :param image: the vtkImageData of the volume, for its extent, spacing and origin
+    :param workers: the number of worker processes
+    :return: the ProcessPoolExecutor and the SharedMemory holding the volume, close both when done
+    """
+    memory, descriptor = share_volume(array)
+    # spawn rather than fork, forking a process that already runs Qt and OpenGL is not safe
+    image_info = (image.GetExtent(), image.GetSpacing(), image.GetOrigin())
+    pool = ProcessPoolExecutor(workers, multiprocessing.get_context('spawn'), _init_worker, (descriptor, image_info))
+    return pool, memory
+
+
+def build_label_surface(label_idx, label_value, extent, smoothness, engine, max_triangles, name=None):
+    """
+    Runs in a worker process: extracts the label from its VOI of the shared volume and runs the surface chain.
+    :param extent: the VOI of the label (xmin, xmax, ymin, ymax, zmin, zmax)
+    :param engine: the smoothing engine, passed explicitly since workers only see the config defaults
+    :param max_triangles: the triangle budget of the label, see vtkUtils.create_polygon_reducer
+    :param name: the name of the label, its filter executions are recorded under it
+    :return: label_idx, the packed mesh (see pack_polydata) and the filter executions recorded by the pipeline
+    observer of the worker (empty without diagnostics)
+    """
+    from vtkUtils import create_surface_polydata, observe, observe_label, pipeline_observer
+
+    memory, array, (whole_extent, spacing, origin) = _volume
+    x0, x1, y0, y1, z0, z1 = (e - whole_extent[i - i % 2] for i, e in enumerate(extent))
+    crop = np.ascontiguousarray(array[z0:z1 + 1, y0:y1 + 1, x0:x1 + 1])  # the only copy of the label box
+    image = vtk.vtkImageData()
+    image.SetExtent(*extent)
+    image.SetSpacing(spacing)
+    image.SetOrigin(origin)
+    scalars = numpy_support.numpy_to_vtk(crop.ravel(), deep=False,
+                                         array_type=numpy_support.get_vtk_array_type(crop.dtype))
+    keep_alive(scalars, crop)  # the image uses the voxels of crop, which must outlive the pipeline
+    image.GetPointData().SetScalars(scalars)
+
+    extractor = observe(vtk.vtkDiscreteMarchingCubes())
+    extractor.SetInputData(image)
+    extractor.SetValue(0, label_value)
+    with observe_label(name):
+        packed = pack_polydata(create_surface_polydata(extractor, smoothness, engine=engine,
+                                                       max_triangles=max_triangles))
+    return label_idx, packed, pipeline_observer.take() if pipeline_observer else []
+
+
+def pack_polydata(polydata):
+    """
+    :return: dict of flat numpy arrays holding the points (float32), triangles (int32) and normals (float32)
+    """
+    packed = {'points': np.empty((0, 3), np.float32), 'triangles': np.empty((0, 3), np.int32), 'normals': None}
+    if not polydata.GetNumberOfCells():
+        return packed
+    polys = polydata.GetPolys()
+    offsets = numpy_support.vtk_to_numpy(polys.GetOffsetsArray())
+    if polys.GetNumberOfCells() != polydata.GetNumberOfCells() or np.any(np.diff(offsets) != 3):
+        raise ValueError("Only meshes of triangles can be packed")
+    packed['points'] = numpy_support.vtk_to_numpy(polydata.GetPoints().GetData()).astype(np.float32)
+    packed['triangles'] = numpy_support.vtk_to_numpy(polys.GetConnectivityArray()).reshape(-1, 3).astype(np.int32)
+    normals = polydata.GetPointData().GetNormals()
+    if normals is not None:
+        packed['normals'] = numpy_support.vtk_to_numpy(normals).astype(np.float32)
+    return packed
+
+
+def unpack_polydata(packed):
+    """
+    :return: the vtkPolyData of a mesh packed by pack_polydata
+    """
+    polydata = vtk.vtkPolyData()
+    if not len(packed['triangles']):
+        return polydata
+    points = vtk.vtkPoints()
+    points.SetData(numpy_support.numpy_to_vtk(packed['points'], deep=True))
+    polydata.SetPoints(points)
+
+    triangles = packed['triangles']
+    id_type = numpy_support.get_vtk_to_numpy_typemap()[vtk.VTK_ID_TYPE]
+    offsets = np.arange(0, 3 * len(triangles) + 1, 3, dtype=id_type)
+    polys = vtk.vtkCellArray()
+    polys.SetData(numpy_support.numpy_to_vtkIdTypeArray(offsets, deep=True),
+                  numpy_support.numpy_to_vtkIdTypeArray(triangles.astype(id_type).ravel(), deep=True))
+    polydata.SetPolys(polys)
+
+    if packed['normals'] is not None:
+        normals = numpy_support.numpy_to_vtk(packed['normals'], deep=True)
+        normals.SetName('Normals')
+        polydata.GetPointData().SetNormals(normals)
+    return polydata
@@ -0,0 +1,75 @@
+import numpy as np
+
+from config import *
+
+'''
+Per-label measures of a label volume, and of an intensity volume inside every label, computed with bincount sweeps
+over the labelled voxels instead of one pass per label:
+
+    label slab -> labelled voxels -> bincount (count, x, y, z, intensity, intensity^2) + min / max at the labels
+
+The volumes are swept in slabs of about STATISTICS_SLAB_VOXELS voxels, so the temporaries stay small for any volume
+size, and every voxel is read once whatever the number of labels.
+'''
+
+
+def iter_slabs(array, slab_voxels=STATISTICS_SLAB_VOXELS):
+    """
+    :return: generator of (z0, z1), the slice ranges of the slabs of a [z, y, x] volume
+    """
+    depth = max(int(slab_voxels // max(array.shape[1] * array.shape[2], 1)), 1)
+    for z0 in range(0, array.shape[0], depth):
+        yield z0, min(z0 + depth, array.shape[0])
+
+
+def compute_label_statistics(labels, spacing=(1.0, 1.0, 1.0), origin=(0.0, 0.0, 0.0), intensities=None,
+                             slab_voxels=STATISTICS_SLAB_VOXELS):
+    """
+    :param labels: the [z, y, x] non negative integer label volume, 0 is the background
+    :param spacing: the voxel spacing (x, y, z)
+    :param origin: the position (x, y, z) of the first voxel
+    :param intensities: optional [z, y, x] volume of the same shape, e.g. the scan the labels were drawn on
+    :return: dict of label value -> dict with the number of voxels, the volume (in units of spacing cubed), the
+    centroid (x, y, z) and, with intensities, the mean, standard deviation, minimum and maximum intensity, for every
+    non zero label
+    """
+    if intensities is not None and intensities.shape != labels.shape:
+        raise ValueError("The intensity volume {} does not match the label volume {}".format(intensities.shape,
+                                                                                         labels.shape))
+    n_values = int(labels.max()) + 1 if labels.size else 1
+    counts = np.zeros(n_values, np.int64)
+    sums = np.zeros((3, n_values))
+    if intensities is not None:
+        intensity_sum, intensity_squares = np.zeros(n_values), np.zeros(n_values)
+        lowest, highest = np.full(n_values, np.inf), np.full(n_values, -np.inf)
+
+    for z0, z1 in iter_slabs(labels, slab_voxels):
+        slab = labels[z0:z1]
+        indices = np.flatnonzero(slab)
+        if not indices.size:
+            continue
+        values = slab.ravel()[indices].astype(np.intp)
+        z, y, x = np.unravel_index(indices, slab.shape)
+        counts += np.bincount(values, minlength=n_values)
+        for axis, coords in enumerate((x, y, z + z0)):
+            sums[axis] += np.bincount(values, weights=coords, minlength=n_values)
+        if intensities is not None:
+            voxels = intensities[z0:z1].ravel()[indices].astype(np.float64)
+            intensity_sum += np.bincount(values, weights=voxels, minlength=n_values)
+            intensity_squares += np.bincount(values, weights=voxels * voxels, minlength=n_values)
+            np.minimum.at(lowest, values, voxels)
+            np.maximum.at(highest, values, voxels)
+
+    statistics = {}
+    for value in np.flatnonzero(counts[1:]) + 1:
+        count = counts[value]
+        label = {'voxels': int(count), 'volume': float(count * np.prod(spacing)),
+                 'centroid': tuple(float(origin[axis] + spacing[axis] * sums[axis, value] / count)
+                                   for axis in range(3))}
+        if intensities is not None:
+            mean = intensity_sum[value] / count
+            label.update(mean=float(mean),
+                         std=float(np.sqrt(max(intensity_squares[value] / count - mean * mean, 0.0))),
+                         min=float(lowest[value]), max=float(highest[value]))
+        statistics[int(value)] = label
+    return statistics
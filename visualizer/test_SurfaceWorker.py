@@ -0,0 +1,57 @@
+import threading
+import time
+
+import PyQt5.QtCore as Qt
+
+from SurfaceWorker import SurfaceWorker
+
+app = Qt.QCoreApplication.instance() or Qt.QCoreApplication([])
+
+
+def wait_until_idle(worker, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not worker.is_idle() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    app.processEvents()  # deliver the results on this (the Qt) thread
+
+
+def test_newer_job_supersedes_and_cancels_older_one():
+    worker = SurfaceWorker()
+    started, cancelled, results = threading.Event(), [], []
+
+    def slow_job(cancel):
+        started.set()
+        cancelled.append(cancel.wait(5.0))
+        return 'old'
+
+    def preview_job(cancel):
+        yield 'preview'
+        yield 'full'
+
+    worker.submit('bone', slow_job, results.append)
+    assert started.wait(5.0)
+    worker.submit('bone', lambda cancel: 'new', results.append)
+    worker.submit('mask', preview_job, results.append)
+    wait_until_idle(worker)
+
+    assert cancelled == [True]
+    assert results == ['new', 'preview', 'full']
+    worker.close()
+
+
+def test_background_job_is_cancelled_by_any_other_job():
+    worker = SurfaceWorker()
+    started, results = threading.Event(), []
+
+    def prefetch(cancel):
+        started.set()
+        cancel.wait(5.0)
+        return cancel.is_set()
+
+    worker.submit('prefetch', prefetch, results.append, background=True)
+    assert started.wait(5.0)
+    worker.submit('bone', lambda cancel: 'bone', results.append)
+    wait_until_idle(worker)
+
+    assert results == ['bone']
+    worker.close()
@@ -0,0 +1,34 @@
+import numpy as np
+
+from niftiUtils import create_image_import
+from VolumePool import VolumePool
+
+
+def read_volume(pool, file_name):
+    pool.put(file_name, create_image_import(np.zeros((16, 32, 64), np.float32), (1.0, 1.0, 1.0)))  # 128 KiB
+
+
+def test_evict_keeps_active_case_and_shared_volumes():
+    pool = VolumePool(max_size=0)
+    for case, files in (('a', ['bone_a', 'shared']), ('b', ['bone_b', 'shared']), ('c', ['bone_c'])):
+        pool.open_case(case, files)
+        for file_name in files:
+            if pool.get(file_name) is None:
+                read_volume(pool, file_name)
+    volume_size = pool.size() // 4
+    assert volume_size >= 128 * 1024
+
+    pool.max_size = 3 * volume_size  # room for three of the four volumes
+    assert pool.evict('a') == ['b']
+    assert pool.get('bone_b') is None and pool.get('shared') is not None  # still used by a
+
+    pool.touch('a')
+    pool.max_size = 0
+    assert pool.evict('a') == ['c']  # never the active case, even over the limit
+    assert pool.get('bone_a') is not None and pool.get('shared') is not None
+
+    pool.open_case('d', ['bone_d'])
+    read_volume(pool, 'bone_d')
+    assert pool.evict('d') == ['a']
+    assert pool.get('shared') is None and pool.get('bone_a') is None
+    assert pool.size() == volume_size
@@ -0,0 +1,17 @@
+from benchmark_suite import *
+
+
+def test_synthetic_volumes():
+    for shape in SHAPES:
+        array = globals()['make_' + shape](32, 4)
+        assert array.shape == (32, 32, 32)
+        assert set(np.unique(array)) <= set(range(5))
+        assert array.max() > 0
+
+
+def test_compare_results():
+    before = {'cases': {'spheres_32_4': {'seconds': {'read_volume': 1.0, 'setup_mask': 2.0}}}}
+    after = {'cases': {'spheres_32_4': {'seconds': {'read_volume': 1.05, 'setup_mask': 3.0}}}}
+    rows, regressions = compare_results(before, after, tolerance=0.1)
+    assert len(rows) == 2
+    assert [(case, stage) for case, stage, *_ in regressions] == [('spheres_32_4', 'setup_mask')]
@@ -0,0 +1,52 @@
+import glob
+import os
+
+import numpy as np
+import pytest
+
+import vtkModules as vtk
+from vtkModules import numpy_support
+from niftiUtils import read_nifti, open_nifti, iter_nifti_slabs
+
+SAMPLE_FILES = sorted(glob.glob(os.path.join(os.path.dirname(__file__), '..', 'sample_data', '*', '*.nii.gz')))
+
+
+def vtk_image_array(image):
+    x0, x1, y0, y1, z0, z1 = image.GetExtent()
+    return numpy_support.vtk_to_numpy(image.GetPointData().GetScalars()).reshape(z1 - z0 + 1, y1 - y0 + 1, x1 - x0 + 1)
+
+
+def read_reference(file_name):
+    reader = vtk.vtkNIFTIImageReader()
+    reader.SetFileName(file_name)
+    reader.Update()
+    return reader
+
+
+@pytest.mark.parametrize('file_name', SAMPLE_FILES, ids=os.path.basename)
+def test_read_nifti_matches_vtk_reader(file_name):
+    reference = read_reference(file_name)
+    importer = read_nifti(file_name)
+    image = importer.GetOutput()
+
+    assert image.GetExtent() == reference.GetOutput().GetExtent()
+    assert np.allclose(image.GetSpacing(), reference.GetOutput().GetSpacing())
+    assert np.array_equal(vtk_image_array(image), vtk_image_array(reference.GetOutput()))
+
+
+@pytest.mark.parametrize('file_name', SAMPLE_FILES, ids=os.path.basename)
+def test_nifti_slabs_match_vtk_reader(file_name):
+    expected = vtk_image_array(read_reference(file_name).GetOutput())
+    stream, header = open_nifti(file_name)
+    volume = np.empty(header['shape'], header['dtype'])
+    with stream:
+        for z0, slab in iter_nifti_slabs(stream, header, 7):
+            volume[z0:z0 + len(slab)] = slab
+
+    assert np.array_equal(volume, expected)
+
+
+def test_nifti_slabs_need_two_slices():
+    stream, header = open_nifti(SAMPLE_FILES[0])
+    with stream, pytest.raises(ValueError):
+        next(iter_nifti_slabs(stream, header, 1))
@@ -0,0 +1,29 @@
+import numpy as np
+import pytest
+
+import vtkModules as vtk
+from vtkModules import numpy_support
+from poolUtils import pack_polydata, unpack_polydata
+
+
+def test_pack_round_trip():
+    sphere = vtk.vtkSphereSource()
+    sphere.SetThetaResolution(16)
+    sphere.SetPhiResolution(16)
+    sphere.Update()
+    polydata = sphere.GetOutput()
+
+    unpacked = unpack_polydata(pack_polydata(polydata))
+
+    assert unpacked.GetNumberOfCells() == polydata.GetNumberOfCells()
+    for get_array in (lambda p: p.GetPoints().GetData(), lambda p: p.GetPolys().GetConnectivityArray(),
+                      lambda p: p.GetPointData().GetNormals()):
+        assert np.allclose(numpy_support.vtk_to_numpy(get_array(unpacked)),
+                           numpy_support.vtk_to_numpy(get_array(polydata)))
+
+
+def test_pack_rejects_other_cells():
+    plane = vtk.vtkPlaneSource()  # one quad
+    plane.Update()
+    with pytest.raises(ValueError):
+        pack_polydata(plane.GetOutput())
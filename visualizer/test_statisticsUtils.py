@@ -0,0 +1,21 @@
+import numpy as np
+
+from statisticsUtils import compute_label_statistics
+
+
+def test_label_statistics_match_per_label_reference():
+    rng = np.random.default_rng(0)
+    labels = rng.integers(0, 6, (12, 10, 8)).astype(np.uint16)
+    intensities = rng.normal(size=labels.shape)
+    statistics = compute_label_statistics(labels, (0.5, 1.0, 2.0), (1.0, 2.0, 3.0), intensities, slab_voxels=100)
+
+    assert sorted(statistics) == [1, 2, 3, 4, 5]
+    for value, label in statistics.items():
+        inside = labels == value
+        z, y, x = np.nonzero(inside)
+        assert label['voxels'] == inside.sum()
+        assert np.isclose(label['volume'], inside.sum())
+        assert np.allclose(label['centroid'], (1 + 0.5 * x.mean(), 2 + y.mean(), 3 + 2 * z.mean()))
+        assert np.allclose([label['mean'], label['std'], label['min'], label['max']],
+                           [intensities[inside].mean(), intensities[inside].std(), intensities[inside].min(),
+                            intensities[inside].max()])
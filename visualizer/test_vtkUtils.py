@@ -0,0 +1,63 @@
+import numpy as np
+
+import vtkModules as vtk
+from vtkModules import numpy_support
+from niftiUtils import create_image_import
+from NiiLabel import NiiLabel
+from NiiObject import NiiObject
+from vtkUtils import allocate_triangles, apply_triangle_budget, compute_label_extents
+
+
+def extract_label(image, label_value, extent=None):
+    source = image
+    if extent is not None:
+        source = vtk.vtkExtractVOI()
+        source.SetInputConnection(image.GetOutputPort())
+        source.SetVOI(*extent)
+    extractor = vtk.vtkDiscreteMarchingCubes()
+    extractor.SetInputConnection(source.GetOutputPort())
+    extractor.SetValue(0, label_value)
+    extractor.Update()
+    return extractor.GetOutput()
+
+
+def test_allocate_triangles_shares_what_small_surfaces_leave():
+    estimates = {'a': 100, 'b': 5000, 'c': 20000, 'd': 0}
+    targets = allocate_triangles(estimates, 9000)
+
+    assert sum(targets.values()) <= 9000
+    assert targets['a'] == 100 and targets['d'] == 0  # under an even share, kept whole
+    assert targets['b'] == 4450 and targets['c'] == 4450  # the rest is split evenly
+    assert allocate_triangles(estimates, 10 ** 6) == estimates
+
+
+def test_triangle_budget_keeps_at_least_one_triangle_per_label():
+    nii_object = NiiObject()
+    for estimated in (0, 3, 1000, 1000):
+        nii_object.labels.append(NiiLabel((1, 1, 1), 1.0, 0))
+        nii_object.labels[-1].estimated_triangles = estimated
+
+    apply_triangle_budget([nii_object], 2)
+
+    assert [label.max_triangles for label in nii_object.labels] == [1, 1, 1, 1]
+
+
+def test_cropped_label_meshes_match_full_volume():
+    labels = np.zeros((14, 12, 10), np.uint8)
+    labels[1:5, 2:7, 0:4] = 1
+    labels[6:13, 5:11, 3:9] = 2
+    labels[8:10, 7:9, 5:7] = 3  # inside label 2
+    labels[0, 0, 9] = 4  # a single voxel in a corner
+    image = create_image_import(labels, (0.5, 1.0, 2.0), (1.0, 2.0, 3.0))
+    whole_extent = image.GetOutput().GetExtent()
+
+    extents = compute_label_extents(labels, whole_extent, slab_voxels=labels.shape[1] * labels.shape[2] * 3)
+
+    assert extents == compute_label_extents(labels, whole_extent)
+    assert sorted(extents) == [1, 2, 3, 4]
+    for value, extent in extents.items():
+        full, cropped = extract_label(image, value), extract_label(image, value, extent)
+        assert cropped.GetNumberOfCells() == full.GetNumberOfCells() > 0
+        for get_array in (lambda p: p.GetPoints().GetData(), lambda p: p.GetPolys().GetConnectivityArray()):
+            assert np.array_equal(numpy_support.vtk_to_numpy(get_array(cropped)),
+                                  numpy_support.vtk_to_numpy(get_array(full)))
@@ -0,0 +1,114 @@
+import argparse
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from batch_export import find_cases, read_manifest, init_worker
+from vtkUtils import *
+
+'''
+Renders axial, coronal and sagittal PNG thumbnails of many cases offscreen, with the actors and cameras of the viewer.
+Every worker process renders its cases in one offscreen window. Without a display VTK renders through EGL or, when
+VTK_DEFAULT_OPENGL_WINDOW=vtkOSOpenGLRenderWindow is set, through OSMesa software rendering.
+'''
+
+VIEWS = {'axial': set_axial_camera, 'coronal': set_coronal_camera, 'sagittal': set_sagittal_camera}
+
+_window = None  # the offscreen renderer and render window of the worker process, see get_offscreen_window
+
+
+def get_offscreen_window(size):
+    """
+    :return: the renderer and offscreen render window of the process, created on the first call
+    """
+    global _window
+    if _window is None:
+        render_window = vtk.vtkRenderWindow()
+        render_window.SetOffScreenRendering(1)
+        renderer = vtk.vtkRenderer()
+        render_window.AddRenderer(renderer)
+        _window = renderer, render_window
+    _window[1].SetSize(size, size)
+    return _window
+
+
+def save_png(render_window, file_name):
+    capture = vtk.vtkWindowToImageFilter()
+    capture.SetInput(render_window)
+    capture.ReadFrontBufferOff()
+    capture.Update()
+    writer = vtk.vtkPNGWriter()
+    writer.SetFileName(file_name)
+    writer.SetInputConnection(capture.GetOutputPort())
+    writer.Write()
+
+
+def render_case_thumbnails(case, output_directory, size=THUMBNAIL_SIZE):
+    """
+    Runs in a worker process: builds the scene of a case as the viewer does and writes one PNG per view to
+    output_directory/name_view.png.
+    :param case: dict with the name, image and mask file of the case (see batch_export.find_cases)
+    :return: dict with the name, written files, seconds and error (if any) of the case
+    """
+    start = time.perf_counter()
+    result = {'name': case['name'], 'files': []}
+    renderer, render_window = get_offscreen_window(size)
+    renderer.RemoveAllViewProps()
+    try:
+        bone = read_bone(case['image']) if case['image'] else None
+        mask = read_mask(case['mask']) if case['mask'] else None
+        apply_triangle_budget([nii_object for nii_object in (bone, mask) if nii_object], SCENE_TRIANGLE_BUDGET)
+        if bone:
+            build_bone(renderer, bone)
+        if mask:
+            build_mask(renderer, mask, workers=1)
+
+        for view, set_camera in VIEWS.items():
+            set_camera(renderer)
+            render_window.Render()
+            file_name = os.path.join(output_directory, '{}_{}.png'.format(case['name'], view))
+            save_png(render_window, file_name)
+            result['files'].append(file_name)
+    except Exception as e:  # one broken case must not stop the others
+        result['error'] = '{}: {}'.format(type(e).__name__, e)
+    renderer.RemoveAllViewProps()
+    result['seconds'] = time.perf_counter() - start
+    return result
+
+
+def render_thumbnails(cases, output_directory, size=THUMBNAIL_SIZE, workers=MASK_WORKERS):
+    """
+    Renders the thumbnails of every case in a pool of worker processes.
+    :return: dict with the results of the cases, the number of thumbnails, seconds and thumbnails per second
+    """
+    start = time.perf_counter()
+    os.makedirs(output_directory, exist_ok=True)
+    # like batch_export, the workers do not use the viewer's mesh cache
+    with ProcessPoolExecutor(max(workers, 1), multiprocessing.get_context('spawn'), init_worker, (False,)) as pool:
+        futures = [pool.submit(render_case_thumbnails, case, output_directory, size) for case in cases]
+        results = [future.result() for future in as_completed(futures)]
+
+    seconds = time.perf_counter() - start
+    thumbnails = sum(len(result['files']) for result in results)
+    return {'cases': sorted(results, key=lambda result: result['name']), 'thumbnails': thumbnails,
+            'seconds': seconds, 'thumbnails_per_second': thumbnails / seconds if seconds else 0.0}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Renders axial, coronal and sagittal thumbnails of many cases.')
+    cases_group = parser.add_mutually_exclusive_group(required=True)
+    cases_group.add_argument('-d', help='a data directory with images/ and labels/ subdirectories')
+    cases_group.add_argument('--manifest', help='a CSV file with the columns name, image and mask')
+    parser.add_argument('-o', required=True, help='the output directory')
+    parser.add_argument('-s', type=int, default=THUMBNAIL_SIZE, help='thumbnail width and height in pixels')
+    parser.add_argument('-w', type=int, default=MASK_WORKERS, help='number of worker processes')
+    args = parser.parse_args()
+
+    summary = render_thumbnails(find_cases(args.d) if args.d else read_manifest(args.manifest), args.o, args.s,
+                                args.w)
+    for result in summary['cases']:
+        if 'error' in result:
+            print("{:<30} {}".format(result['name'], result['error']))
+    print("{} thumbnails in {:.1f}s, {:.1f} thumbnails per second".format(
+        summary['thumbnails'], summary['seconds'], summary['thumbnails_per_second']))
@@ -0,0 +1,61 @@
+import importlib
+
+'''
+The part of VTK the visualizer uses, imported on first use:
+
+    import vtkModules as vtk
+    vtk.vtkFlyingEdges3D()      # imports vtkmodules.vtkFiltersCore the first time
+
+`import vtk` loads every VTK module (about 170 of them) before the first line of the application runs. The classes
+used here live in a dozen modules, which are imported from the vtkmodules package when a class of theirs is first
+used, together with the OpenGL implementations when it is a rendering class. Names that are not listed in
+VTK_MODULES come from the full vtk package.
+'''
+
+from vtkmodules.util import numpy_support
+
+VTK_MODULES = {
+    'vtkCommonCore': ('VTK_ID_TYPE', 'vtkFileOutputWindow', 'vtkLookupTable', 'vtkPoints', 'vtkVersion'),
+    'vtkCommonDataModel': ('vtkCellArray', 'vtkDataObject', 'vtkDataSetAttributes', 'vtkImageData',
+                           'vtkPiecewiseFunction', 'vtkPolyData'),
+    'vtkFiltersCore': ('vtkAppendPolyData', 'vtkCleanPolyData', 'vtkDecimatePro', 'vtkFlyingEdges3D',
+                       'vtkMassProperties', 'vtkPolyDataNormals', 'vtkQuadricClustering', 'vtkSmoothPolyDataFilter',
+                       'vtkThreshold', 'vtkWindowedSincPolyDataFilter'),
+    'vtkFiltersGeneral': ('vtkDiscreteMarchingCubes',),
+    'vtkFiltersGeometry': ('vtkGeometryFilter',),
+    'vtkIOGeometry': ('vtkSTLWriter',),
+    'vtkIOImage': ('vtkImageImport', 'vtkNIFTIImageReader', 'vtkNIFTIImageWriter', 'vtkPNGWriter'),
+    'vtkIOPLY': ('vtkPLYWriter',),
+    'vtkIOXML': ('vtkXMLPolyDataReader', 'vtkXMLPolyDataWriter'),
+    'vtkImagingCore': ('vtkExtractVOI', 'vtkImageShrink3D'),
+    'vtkInteractionStyle': ('vtkInteractorStyleTrackballCamera',),
+    'vtkRenderingCore': ('vtkColorTransferFunction', 'vtkImageActor', 'vtkImageProperty', 'vtkImageSlice',
+                         'vtkPolyDataMapper', 'vtkProperty', 'vtkRenderWindow', 'vtkRenderer', 'vtkVolume',
+                         'vtkVolumeProperty', 'vtkWindowToImageFilter'),
+    'vtkRenderingImage': ('vtkImageResliceMapper',),
+    'vtkRenderingLOD': ('vtkLODActor',),
+    'vtkRenderingVolume': ('vtkFixedPointVolumeRayCastMapper',),
+}
+# register the OpenGL implementations of the abstract rendering classes (vtkRenderer, vtkPolyDataMapper, ...)
+RENDERING_BACKENDS = ('vtkRenderingOpenGL2', 'vtkRenderingVolumeOpenGL2', 'vtkInteractionStyle')
+
+_module_of = {name: module for module, names in VTK_MODULES.items() for name in names}
+
+
+def import_module(module):
+    if module.startswith(('vtkRendering', 'vtkInteraction')):
+        for backend in RENDERING_BACKENDS:
+            importlib.import_module('vtkmodules.' + backend)
+    return importlib.import_module('vtkmodules.' + module)
+
+
+def __getattr__(name):
+    """
+    Resolves a VTK name on first use and keeps it in the module, so later uses are plain attribute lookups.
+    """
+    if name.startswith('__'):
+        raise AttributeError(name)
+    module = import_module(_module_of[name]) if name in _module_of else importlib.import_module('vtk')
+    value = getattr(module, name)
+    globals()[name] = value
+    return value
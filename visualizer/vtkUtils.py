@@ -1,87 +1,408 @@
-import vtk
+import colorsys
+import contextlib
+import math
+import resource
+import time
+
+import numpy as np
+import vtkModules as vtk
+from vtkModules import numpy_support
 from ErrorObserver import *
+from PipelineObserver import *
+from MeshCache import *
+from SurfaceCache import *
+from VolumeCache import *
+from VolumePool import *
 from NiiObject import *
 from config import *
 from NiiLabel import *
+from niftiUtils import read_nifti, open_nifti, iter_nifti_slabs
+from statisticsUtils import compute_label_statistics, iter_slabs
 
 error_observer = ErrorObserver()
+mesh_cache = MeshCache(MESH_CACHE_DIR, MESH_CACHE_SIZE) if MESH_CACHE_ENABLED else None
+surface_cache = SurfaceCache(SURFACE_CACHE_SIZE)
+volume_cache = VolumeCache(VOLUME_CACHE_DIR, VOLUME_CACHE_SIZE) if VOLUME_CACHE_ENABLED else None
+pipeline_observer = PipelineObserver() if PIPELINE_DIAGNOSTICS else None
+volume_pool = None  # the volumes shared by the cases of a session, see VolumePool and MainWindow
 
 '''
 VTK Pipeline:   reader ->
+                voi (label bounding box) ->
                 extractor -> 
                 decimate -> 
                 smoother -> 
                 normalizer -> 
+                surface cache (memory) / mesh cache (disk) ->
                 mapper
 '''
 
 
 def read_volume(file_name):
     """
-    :param file_name: The filename of type 'nii.gz'
-    :return: vtkNIFTIImageReader (https://www.vtk.org/doc/nightly/html/classvtkNIFTIImageReader.html)
+    :param file_name: The filename of type 'nii' or 'nii.gz'
+    :return: the updated image source of the volume: the one already read by another case of the volume pool, a
+    vtkImageImport when the volume is in the volume cache or niftiUtils can read it (see niftiUtils.read_nifti),
+    otherwise a vtkNIFTIImageReader (https://www.vtk.org/doc/nightly/html/classvtkNIFTIImageReader.html)
     """
-    reader = vtk.vtkNIFTIImageReader()
-    reader.SetFileNameSliceOffset(1)
-    reader.SetDataByteOrderToBigEndian()
-    reader.SetFileName(file_name)
-    reader.Update()
+    reader = volume_pool.get(file_name) if volume_pool else None
+    if reader is not None:
+        return reader
+
+    start, start_rss = time.perf_counter(), current_rss()
+    reader = volume_cache.load(file_name) if volume_cache else None
+    if reader is not None:
+        if pipeline_observer:
+            pipeline_observer.record('VolumeCache', start, start_rss, reader.GetOutput())
+        if volume_pool:
+            volume_pool.put(file_name, reader)
+        return reader
+
+    if FAST_NIFTI_READER:
+        reader = read_nifti(file_name)
+    if reader is None:
+        reader = vtk.vtkNIFTIImageReader()
+        reader.SetFileNameSliceOffset(1)
+        reader.SetDataByteOrderToBigEndian()
+        reader.SetFileName(file_name)
+        reader.Update()
+    if pipeline_observer:
+        pipeline_observer.record(reader.GetClassName(), start, start_rss, reader.GetOutput())
+    if volume_cache:
+        volume_cache.save(file_name, reader.GetOutput())
+    if volume_pool:
+        volume_pool.put(file_name, reader)
     return reader
 
 
-def create_bone_extractor(bone):
+def observe(algorithm):
+    """
+    Records the executions of a filter in the pipeline observer, if diagnostics are enabled (see PIPELINE_DIAGNOSTICS).
+    :return: the algorithm
+    """
+    return pipeline_observer.attach(algorithm) if pipeline_observer else algorithm
+
+
+def observe_label(name):
+    """
+    :return: a context manager recording the filters executed inside it under the label name, see PipelineObserver
+    """
+    return pipeline_observer.label(name) if pipeline_observer else contextlib.nullcontext()
+
+
+def release_data(algorithm):
+    """
+    Makes an intermediate filter free its output once the filters downstream have executed, in MEMORY_LEAN mode. The
+    output is computed again when a parameter change (value, smoothness, budget) needs it.
+    :return: the algorithm
+    """
+    if MEMORY_LEAN:
+        algorithm.ReleaseDataFlagOn()
+    return algorithm
+
+
+def detach_output(algorithm):
+    """
+    :return: the output of the last filter of a chain. In MEMORY_LEAN mode it is a shallow copy, which shares the
+    arrays but does not keep the filters of the chain and their outputs alive.
+    """
+    if not MEMORY_LEAN:
+        return algorithm.GetOutput()
+    polydata = vtk.vtkPolyData()
+    polydata.ShallowCopy(algorithm.GetOutput())
+    return polydata
+
+
+def get_volume_array(nii_object):
+    """
+    :param nii_object: a NiiObject with a reader
+    :return: a numpy view (no copy) of the volume scalars indexed as [z, y, x]
+    """
+    x0, x1, y0, y1, z0, z1 = nii_object.extent
+    scalars = nii_object.reader.GetOutput().GetPointData().GetScalars()
+    return numpy_support.vtk_to_numpy(scalars).reshape(z1 - z0 + 1, y1 - y0 + 1, x1 - x0 + 1)
+
+
+def pad_extent(extent, whole_extent, padding=1):
+    """
+    Grows a voxel extent by padding voxels on each side, clamped to the whole extent of the volume. One voxel of
+    padding keeps every cell touching the region, so surfaces extracted from the padded extent are identical to the
+    ones extracted from the full volume.
+    """
+    return tuple(max(extent[i] - padding, whole_extent[i]) if i % 2 == 0 else
+                 min(extent[i] + padding, whole_extent[i]) for i in range(6))
+
+
+def compute_label_extents(array, whole_extent, padding=1, slab_voxels=STATISTICS_SLAB_VOXELS):
+    """
+    Computes the padded voxel bounding box of every label in one sweep over the label volume. The volume is swept in
+    slabs (see statisticsUtils.iter_slabs), so the index temporaries are bounded by the slab size rather than by the
+    number of labelled voxels.
+    :param array: the label volume as returned by get_volume_array
+    :param whole_extent: the extent of the volume (xmin, xmax, ymin, ymax, zmin, zmax)
+    :param padding: number of voxels added around each bounding box
+    :param slab_voxels: number of voxels swept at a time
+    :return: dict of label value -> extent (xmin, xmax, ymin, ymax, zmin, zmax) for every non zero label
+    """
+    if not array.size:
+        return {}
+    n_values = int(array.max()) + 1
+    lower = np.full((n_values, 3), np.iinfo(np.intp).max, dtype=np.intp)
+    upper = np.full((n_values, 3), -1, dtype=np.intp)
+    for z0, z1 in iter_slabs(array, slab_voxels):
+        slab = array[z0:z1]
+        indices = np.flatnonzero(slab)
+        if not indices.size:
+            continue
+        values = slab.ravel()[indices].astype(np.intp)
+        z, y, x = np.unravel_index(indices, slab.shape)
+        for axis, coords in enumerate((x, y, z + z0)):
+            np.minimum.at(lower[:, axis], values, coords)
+            np.maximum.at(upper[:, axis], values, coords)
+
+    extents = {}
+    for value in np.flatnonzero(upper[:, 0] >= 0):
+        extent = (lower[value, 0] + whole_extent[0], upper[value, 0] + whole_extent[0],
+                  lower[value, 1] + whole_extent[2], upper[value, 1] + whole_extent[2],
+                  lower[value, 2] + whole_extent[4], upper[value, 2] + whole_extent[4])
+        extents[int(value)] = pad_extent([int(e) for e in extent], whole_extent, padding)
+    return extents
+
+
+def compute_threshold_extent(array, whole_extent, threshold, padding=1):
+    """
+    Computes the padded voxel bounding box of the voxels at or above threshold.
+    :return: the extent (xmin, xmax, ymin, ymax, zmin, zmax), or whole_extent if no voxel reaches the threshold
+    """
+    above = array >= threshold
+    extent = []
+    for axis in ((0, 1), (0, 2), (1, 2)):  # x, y and z projections of the [z, y, x] array
+        hits = np.flatnonzero(above.any(axis=axis))
+        if not hits.size:
+            return tuple(whole_extent)
+        extent += [int(hits[0]) + whole_extent[len(extent)], int(hits[-1]) + whole_extent[len(extent)]]
+    return pad_extent(extent, whole_extent, padding)
+
+
+def extent_size(extent):
+    """
+    :return: the number of voxels inside the extent
+    """
+    return (extent[1] - extent[0] + 1) * (extent[3] - extent[2] + 1) * (extent[5] - extent[4] + 1)
+
+
+def count_boundary_faces(array):
+    """
+    Counts, for every label, the voxel faces between the label and another value in one sweep per axis. Discrete
+    marching cubes and flying edges emit about two triangles per boundary face, so this estimates the size of every
+    surface before anything is extracted.
+    :param array: a non negative integer (or boolean) [z, y, x] volume
+    :return: numpy array of label value -> number of boundary faces
+    """
+    faces = np.zeros(int(array.max()) + 1, dtype=np.int64)
+    for axis in range(3):
+        volume = np.moveaxis(array, axis, 0)
+        boundary = volume[1:] != volume[:-1]
+        for side in (volume[1:], volume[:-1]):
+            faces += np.bincount(side[boundary], minlength=len(faces))
+    return faces
+
+
+def estimate_label_triangles(array):
+    """
+    :return: dict of label value -> estimated number of extracted triangles for every non zero label
+    """
+    faces = count_boundary_faces(array)
+    return {int(value): 2 * int(faces[value]) for value in np.flatnonzero(faces[1:]) + 1}
+
+
+def estimate_threshold_triangles(array, threshold):
+    """
+    :return: the estimated number of triangles of the surface at threshold
+    """
+    faces = count_boundary_faces(array >= threshold)
+    return 2 * int(faces[1]) if len(faces) > 1 else 0
+
+
+def allocate_triangles(estimates, budget):
+    """
+    Splits a triangle budget over surfaces: surfaces smaller than an even share keep all their triangles, and what
+    they leave unused is shared among the bigger ones.
+    :param estimates: dict of surface -> estimated number of extracted triangles
+    :param budget: the total number of triangles
+    :return: dict of surface -> maximum number of triangles
+    """
+    targets = {}
+    remaining = budget
+    ordered = sorted(estimates.items(), key=lambda item: item[1])
+    for i, (surface, triangles) in enumerate(ordered):
+        targets[surface] = int(min(triangles, remaining / (len(ordered) - i)))
+        remaining -= targets[surface]
+    return targets
+
+
+def apply_triangle_budget(nii_objects, budget):
+    """
+    Sets the maximum number of triangles of every label of the scene from the estimated size of its surface, so the
+    whole scene stays within budget triangles.
+    """
+    labels = [label for nii_object in nii_objects for label in nii_object.labels]
+    targets = allocate_triangles({i: label.estimated_triangles for i, label in enumerate(labels)}, budget)
+    for i, label in enumerate(labels):
+        label.max_triangles = max(targets[i], 1)
+
+
+def tune_triangle_budget(budget, frame_time, target_frame_time=1.0 / TARGET_FRAME_RATE):
+    """
+    :param budget: the current triangle budget
+    :param frame_time: the measured time of a frame in seconds
+    :return: the budget scaled towards the target frame time, by a factor between 0.5 and 2
+    """
+    return int(budget * min(max(target_frame_time / max(frame_time, 1e-6), 0.5), 2.0))
+
+
+def create_voi(nii_object, extent):
+    """
+    Crops the volume to a sub-volume (volume of interest). The output keeps the origin and spacing of the volume, so
+    geometry extracted from it lines up with the full volume.
+    (https://www.vtk.org/doc/nightly/html/classvtkExtractVOI.html)
+    :param nii_object: a NiiObject with a reader
+    :param extent: the voxel extent (xmin, xmax, ymin, ymax, zmin, zmax) to keep
+    :return: the vtkExtractVOI
+    """
+    voi = release_data(observe(vtk.vtkExtractVOI()))
+    voi.SetInputData(nii_object.reader.GetOutput())
+    voi.SetVOI(*extent)
+    return voi
+
+
+def crop_to_threshold(nii_object, label_idx, threshold):
+    """
+    Moves the VOI of a thresholded label (the bone) to the bounding box of the voxels at or above threshold.
+    """
+    extent = compute_threshold_extent(get_volume_array(nii_object), nii_object.extent, threshold)
+    nii_object.labels[label_idx].voi.SetVOI(*extent)
+
+
+def connect_volume(extractor, nii_object, source=None):
+    """
+    Feeds the source algorithm, or the already read volume, into an extractor. The volume is passed as data rather
+    than as a pipeline connection, so surfaces can be computed on a worker thread without updating the shared reader.
+    """
+    if source:
+        extractor.SetInputConnection(source.GetOutputPort())
+    else:
+        extractor.SetInputData(nii_object.reader.GetOutput())
+
+
+def create_bone_extractor(bone, source=None):
     """
     Given the output from bone (vtkNIFTIImageReader) extract it into 3D using
     vtkFlyingEdges3D algorithm (https://www.vtk.org/doc/nightly/html/classvtkFlyingEdges3D.html)
     :param bone: a vtkNIFTIImageReader volume containing the bone
+    :param source: optional algorithm (e.g. a VOI from create_voi) to extract from instead of the whole volume
     :return: the extracted volume from vtkFlyingEdges3D
     """
-    bone_extractor = vtk.vtkFlyingEdges3D()
-    bone_extractor.SetInputConnection(bone.reader.GetOutputPort())
+    bone_extractor = release_data(observe(vtk.vtkFlyingEdges3D()))
+    connect_volume(bone_extractor, bone, source)
     # bone_extractor.SetValue(0, sum(bone.scalar_range)/2)
     return bone_extractor
 
 
-def create_mask_extractor(mask):
+def create_mask_extractor(mask, label_values=None, source=None):
     """
     Given the output from mask (vtkNIFTIImageReader) extract it into 3D using
     vtkDiscreteMarchingCubes algorithm (https://www.vtk.org/doc/release/5.0/html/a01331.html).
     This algorithm is specialized for reading segmented volume labels.
     :param mask: a vtkNIFTIImageReader volume containing the mask
+    :param label_values: optional list of label values to extract in a single pass over the volume. The label value of
+    every triangle is stored in the output cell scalars so the surface can be split with create_label_selector
+    :param source: optional algorithm (e.g. a VOI from create_voi) to extract from instead of the whole volume
     :return: the extracted volume from vtkDiscreteMarchingCubes
     """
-    mask_extractor = vtk.vtkDiscreteMarchingCubes()
-    mask_extractor.SetInputConnection(mask.reader.GetOutputPort())
+    mask_extractor = observe(vtk.vtkDiscreteMarchingCubes())
+    connect_volume(mask_extractor, mask, source)
+    if label_values:
+        mask_extractor.ComputeScalarsOn()
+        for i, label_value in enumerate(label_values):
+            mask_extractor.SetValue(i, label_value)
+    else:  # the single pass output is kept, it feeds the selectors of all its labels
+        release_data(mask_extractor)
     return mask_extractor
 
 
-def create_polygon_reducer(extractor):
+def create_label_selector(extractor, label_value):
+    """
+    Selects the triangles of a single label from a multi-label extractor (see create_mask_extractor) using the
+    per-cell label scalars, and converts them back into polygonal data for the rest of the pipeline.
+    (https://www.vtk.org/doc/nightly/html/classvtkThreshold.html)
+    :param extractor: a vtkDiscreteMarchingCubes that was given several label values
+    :param label_value: the label value to select
+    :return: a vtkGeometryFilter producing the surface of the label
+    """
+    threshold = release_data(observe(vtk.vtkThreshold()))
+    threshold.SetInputConnection(extractor.GetOutputPort())
+    threshold.SetInputArrayToProcess(0, 0, 0, vtk.vtkDataObject.FIELD_ASSOCIATION_CELLS,
+                                     vtk.vtkDataSetAttributes.SCALARS)
+    if hasattr(threshold, 'ThresholdBetween'):
+        threshold.ThresholdBetween(label_value - 0.5, label_value + 0.5)
+    else:  # VTK >= 9.1
+        threshold.SetLowerThreshold(label_value - 0.5)
+        threshold.SetUpperThreshold(label_value + 0.5)
+
+    selector = release_data(observe(vtk.vtkGeometryFilter()))
+    selector.SetInputConnection(threshold.GetOutputPort())
+    return selector
+
+
+def create_polygon_reducer(extractor, max_triangles=None):
     """
     Reduces the number of polygons (triangles) in the volume. This is used to speed up rendering.
     (https://www.vtk.org/doc/nightly/html/classvtkDecimatePro.html)
     :param extractor: an extractor (vtkPolyDataAlgorithm), will be either vtkFlyingEdges3D or vtkDiscreteMarchingCubes
+    :param max_triangles: the number of triangles to reduce the extracted surface to, see allocate_triangles. The
+    extractor must be up to date. Without it MESH_REDUCTION of the triangles are removed.
     :return: the decimated volume
     """
-    reducer = vtk.vtkDecimatePro()
+    reducer = release_data(observe(vtk.vtkDecimatePro()))
     reducer.AddObserver('ErrorEvent', error_observer)  # throws an error event if there is no data to decimate
     reducer.SetInputConnection(extractor.GetOutputPort())
-    reducer.SetTargetReduction(0.5)  # magic number
+    if max_triangles is None:
+        reducer.SetTargetReduction(MESH_REDUCTION)
+    else:
+        triangles = extractor.GetOutput().GetNumberOfCells()
+        reducer.SetTargetReduction(max(0.0, 1.0 - max_triangles / triangles) if triangles else 0.0)
     reducer.PreserveTopologyOn()
     return reducer
 
 
-def create_smoother(reducer, smoothness):
+def create_smoother(reducer, smoothness, engine=None):
     """
-    Reorients some points in the volume to smooth the render edges.
-    (https://www.vtk.org/doc/nightly/html/classvtkSmoothPolyDataFilter.html)
-    :param reducer:
-    :param smoothness:
-    :return:
+    Reorients some points in the volume to smooth the render edges. The smoothness is the value of the smoothness spin
+    box, which counts Laplacian iterations. Engines:
+    'sinc': windowed sinc low pass filter, fast and with little shrinkage. It runs SINC_ITERATIONS iterations with a
+        pass band of 10 ** (-smoothness / 250): 100 -> 0.4 (light), 500 -> 0.01 (default), 1000 -> 0.0001 (heavy).
+        (https://www.vtk.org/doc/nightly/html/classvtkWindowedSincPolyDataFilter.html)
+    'laplacian': up to smoothness Laplacian iterations, stopping early once no point moves more than
+        SMOOTHING_CONVERGENCE times the diagonal of the mesh bounding box. Shrinks the mesh.
+        (https://www.vtk.org/doc/nightly/html/classvtkSmoothPolyDataFilter.html)
+    :param reducer: the algorithm producing the mesh to smooth
+    :param smoothness: the smoothness spin box value
+    :param engine: 'sinc' or 'laplacian', defaults to SMOOTHING_ENGINE
+    :return: the smoothing filter
     """
-    smoother = vtk.vtkSmoothPolyDataFilter()
+    if (engine or SMOOTHING_ENGINE) == 'sinc':
+        smoother = vtk.vtkWindowedSincPolyDataFilter()
+        smoother.SetNumberOfIterations(SINC_ITERATIONS)
+        smoother.SetPassBand(10 ** (-smoothness / 250))
+        smoother.NormalizeCoordinatesOn()
+        smoother.NonManifoldSmoothingOn()
+    else:
+        smoother = vtk.vtkSmoothPolyDataFilter()
+        smoother.SetNumberOfIterations(smoothness)
+        smoother.SetConvergence(SMOOTHING_CONVERGENCE)
     smoother.SetInputConnection(reducer.GetOutputPort())
-    smoother.SetNumberOfIterations(smoothness)
-    return smoother
+    return release_data(observe(smoother))
 
 
 def create_normals(smoother):
@@ -92,15 +413,15 @@ def create_normals(smoother):
     :param smoother:
     :return:
     """
-    bone_normals = vtk.vtkPolyDataNormals()
+    bone_normals = observe(vtk.vtkPolyDataNormals())
     bone_normals.SetInputConnection(smoother.GetOutputPort())
     bone_normals.SetFeatureAngle(60.0)  #
     return bone_normals
 
 
-def create_mapper(stripper):
-    bone_mapper = vtk.vtkPolyDataMapper()
-    bone_mapper.SetInputConnection(stripper.GetOutputPort())
+def create_mapper(polydata):
+    bone_mapper = observe(vtk.vtkPolyDataMapper())
+    bone_mapper.SetInputData(polydata)
     bone_mapper.ScalarVisibilityOff()
     bone_mapper.Update()
     return bone_mapper
@@ -113,13 +434,61 @@ def create_property(opacity, color):
     return prop
 
 
-def create_actor(mapper, prop):
-    actor = vtk.vtkActor()
+def create_lod_polydata(polydata):
+    """
+    Clusters a mesh into a coarse one with at most LOD_DIVISIONS cells along each axis of its bounding box.
+    (https://www.vtk.org/doc/nightly/html/classvtkQuadricClustering.html)
+    :return: the low resolution vtkPolyData
+    """
+    clustering = release_data(observe(vtk.vtkQuadricClustering()))
+    clustering.SetInputData(polydata)
+    clustering.SetNumberOfDivisions(LOD_DIVISIONS, LOD_DIVISIONS, LOD_DIVISIONS)
+    clustering.AutoAdjustNumberOfDivisionsOn()
+    normals = create_normals(clustering)
+    normals.Update()
+    return detach_output(normals)
+
+
+def with_lod(polydata):
+    """
+    Pairs a finished mesh with its low resolution version for show_surface. Clustering takes a while on big meshes, so
+    this runs in the surface jobs on the worker thread rather than when the mesh is shown.
+    :return: (polydata, low resolution polydata or None for an empty mesh), or None if polydata is None (cancelled)
+    """
+    if polydata is None:
+        return None
+    return polydata, create_lod_polydata(polydata) if polydata.GetNumberOfCells() else None
+
+
+def create_actor(mapper, prop, lod=None):
+    """
+    Creates a level of detail actor: while the interactor is moving the camera, the renderer gives each actor a share
+    of 1 / desired update rate seconds, and the actor draws its low resolution mesh (see set_actor_polydata) when the
+    full resolution mesh took longer than that. Still renders always use the full resolution mesh.
+    (https://www.vtk.org/doc/nightly/html/classvtkLODActor.html)
+    """
+    actor = vtk.vtkLODActor()
     actor.SetMapper(mapper)
     actor.SetProperty(prop)
+    lod_mapper = vtk.vtkPolyDataMapper()
+    lod_mapper.ScalarVisibilityOff()
+    actor.AddLODMapper(lod_mapper)
+    set_actor_polydata(actor, mapper.GetInput(), lod)
     return actor
 
 
+def set_actor_polydata(actor, polydata, lod=None):
+    """
+    Shows a mesh in an actor created by create_actor, along with its low resolution version.
+    :param lod: the low resolution mesh (see with_lod), None to draw polydata itself, e.g. for coarse previews
+    """
+    actor.GetMapper().SetInputData(polydata)
+    lod_mappers = actor.GetLODMappers()
+    lod_mappers.InitTraversal()
+    lod_mapper = lod_mappers.GetNextItem()
+    lod_mapper.SetInputData(polydata if lod is None else lod)
+
+
 def create_mask_table():
     m_mask_opacity = 1
     bone_lut = vtk.vtkLookupTable()
@@ -155,20 +524,395 @@ def create_table():
 
 
 def add_surface_rendering(nii_object, label_idx, label_value):
-    nii_object.labels[label_idx].extractor.SetValue(0, label_value)
-    nii_object.labels[label_idx].extractor.Update()
-
-    # if the cell size is 0 then there is no label_idx data
-    if nii_object.labels[label_idx].extractor.GetOutput().GetMaxCellSize():
-        reducer = create_polygon_reducer(nii_object.labels[label_idx].extractor)
-        smoother = create_smoother(reducer, nii_object.labels[label_idx].smoothness)
-        normals = create_normals(smoother)
-        actor_mapper = create_mapper(normals)
-        actor_property = create_property(nii_object.labels[label_idx].opacity, nii_object.labels[label_idx].color)
-        actor = create_actor(actor_mapper, actor_property)
-        nii_object.labels[label_idx].actor = actor
-        nii_object.labels[label_idx].smoother = smoother
-        nii_object.labels[label_idx].property = actor_property
+    """
+    Sets the value (label value or threshold) of a label and shows its surface, see update_surface_rendering.
+    """
+    set_surface_value(nii_object, label_idx, label_value)
+    update_surface_rendering(nii_object, label_idx)
+
+
+def set_surface_value(nii_object, label_idx, label_value):
+    label = nii_object.labels[label_idx]
+    label.value = label_value
+    if label.surface is None:
+        label.surface = label.extractor
+    if label.surface is label.extractor:
+        label.extractor.SetValue(0, label_value)
+
+
+def abort_on_cancel(algorithm, cancel):
+    """
+    Makes a filter stop executing at its next progress update once the cancel event is set.
+    """
+    if cancel is not None:
+        algorithm.AddObserver('ProgressEvent', lambda caller, event: cancel.is_set() and caller.SetAbortExecute(1))
+
+
+def mesh_parameters(smoothness, max_triangles):
+    """
+    :return: the parameters a finished mesh depends on besides its volume and value, as used in the cache keys
+    """
+    return smoothness, MESH_REDUCTION if max_triangles is None else max_triangles, SMOOTHING_ENGINE
+
+
+def decimate_surface(surface, cancel=None, max_triangles=None):
+    """
+    Runs the decimation of the surface chain on an extracted surface, see create_surface_polydata.
+    :param surface: a vtkPolyDataAlgorithm producing the extracted surface of a label
+    :param cancel: optional threading.Event, the decimation is aborted once it is set
+    :param max_triangles: the triangle budget of the surface, see create_polygon_reducer
+    :return: the decimated vtkPolyData, empty if the surface has no cells, or None if cancelled
+    """
+    surface.Update()
+    # if the cell size is 0 then there is no label data
+    if not surface.GetOutput().GetMaxCellSize():
+        return vtk.vtkPolyData()
+
+    reducer = create_polygon_reducer(surface, max_triangles)
+    abort_on_cancel(reducer, cancel)
+    reducer.Update()
+    if cancel is not None and cancel.is_set():
+        return None
+    return detach_output(reducer)
+
+
+def smooth_surface(decimated, smoothness, cancel=None, engine=None):
+    """
+    Runs the smooth -> normals end of the surface chain on a mesh returned by decimate_surface.
+    :return: the finished vtkPolyData, empty if the mesh has no cells, or None if cancelled
+    """
+    if not decimated.GetNumberOfCells():
+        return vtk.vtkPolyData()
+
+    producer = vtk.vtkTrivialProducer()
+    producer.SetOutput(decimated)
+    smoother = create_smoother(producer, smoothness, engine)
+    normals = create_normals(smoother)
+    for algorithm in (smoother, normals):
+        abort_on_cancel(algorithm, cancel)
+    normals.Update()
+    if cancel is not None and cancel.is_set():
+        return None
+    return detach_output(normals)
+
+
+def create_surface_polydata(surface, smoothness, cancel=None, engine=None, max_triangles=None):
+    """
+    Runs the decimate -> smooth -> normals chain on an extracted surface.
+    :param surface: a vtkPolyDataAlgorithm producing the extracted surface of a label
+    :param smoothness: the smoothness spin box value, see create_smoother
+    :param cancel: optional threading.Event, the chain is aborted once it is set
+    :param engine: the smoothing engine, defaults to SMOOTHING_ENGINE
+    :param max_triangles: the triangle budget of the surface, see create_polygon_reducer
+    :return: the finished vtkPolyData, empty if the surface has no cells, or None if cancelled
+    """
+    decimated = decimate_surface(surface, cancel, max_triangles)
+    if decimated is None:
+        return None
+    return smooth_surface(decimated, smoothness, cancel, engine)
+
+
+def compute_surface(nii_object, label_idx, cancel=None):
+    """
+    Computes the mesh of a label from its current value and smoothness. Finished meshes are loaded from and stored in
+    the surface cache and the mesh cache. Does not touch the actor, so it can run on a worker thread.
+    The decimated mesh of the label is kept, so a change of the smoothness alone only runs the smoother again, not the
+    extraction and decimation (whose outputs MEMORY_LEAN frees).
+    :param nii_object: the NiiObject owning the label
+    :param label_idx: index of the label in nii_object.labels
+    :param cancel: optional threading.Event, the computation is aborted once it is set
+    :return: the vtkPolyData, or None if cancelled
+    """
+    label = nii_object.labels[label_idx]
+    polydata = load_cached_surface(nii_object, label_idx, label.value, label.smoothness)
+    if polydata is not None:
+        return polydata
+
+    with observe_label(label.name):
+        parameters = (label.value, label.max_triangles)
+        if label.decimated is None or label.decimated[0] != parameters:
+            decimated = decimate_surface(label.surface, cancel, label.max_triangles)
+            if decimated is None:
+                return None
+            label.decimated = parameters, decimated
+        polydata = smooth_surface(label.decimated[1], label.smoothness, cancel)
+    if polydata is not None:
+        store_cached_surface(nii_object, label_idx, label.value, label.smoothness, polydata)
+    return polydata
+
+
+def store_cached_surface(nii_object, label_idx, value, smoothness, polydata):
+    """
+    Stores a finished mesh in the surface cache and the mesh cache, see load_cached_surface.
+    """
+    parameters = mesh_parameters(smoothness, nii_object.labels[label_idx].max_triangles)
+    surface_cache.put(surface_cache.key(nii_object.file, value, *parameters), polydata)
+    if mesh_cache and nii_object.file_hash:
+        mesh_cache.save(mesh_cache.key(nii_object.file_hash, value, *parameters), polydata)
+
+
+def load_cached_surface(nii_object, label_idx, value, smoothness):
+    """
+    :return: the mesh of the label with this value (label value or threshold) and smoothness from the surface cache or
+    the mesh cache, or None
+    """
+    parameters = mesh_parameters(smoothness, nii_object.labels[label_idx].max_triangles)
+    memory_key = surface_cache.key(nii_object.file, value, *parameters)
+    polydata = surface_cache.get(memory_key)
+    if polydata is None and mesh_cache and nii_object.file_hash:
+        polydata = mesh_cache.load(mesh_cache.key(nii_object.file_hash, value, *parameters))
+        if polydata is not None:
+            surface_cache.put(memory_key, polydata)
+    return polydata
+
+
+def prefetch_bone_surfaces(bone, thresholds, smoothness, cancel=None):
+    """
+    Computes the finished bone surfaces of the given thresholds into the surface cache, skipping the cached ones.
+    Meant to run on the worker thread while the user is idle. The surfaces are extracted with their own VOI and
+    extractor, so the value, smoothness and VOI of the bone label keep matching the surface that is shown.
+    :param thresholds: the thresholds to prefetch, most likely first
+    :return: the number of surfaces computed
+    """
+    label = bone.labels[0]
+    voi = create_voi(bone, bone.extent)
+    extractor = create_bone_extractor(bone, voi)
+    computed = 0
+    for threshold in thresholds:
+        if cancel is not None and cancel.is_set():
+            break
+        if surface_cache.key(bone.file, threshold, *mesh_parameters(smoothness, label.max_triangles)) in \
+                surface_cache:
+            continue
+        voi.SetVOI(*compute_threshold_extent(get_volume_array(bone), bone.extent, threshold))
+        extractor.SetValue(0, threshold)
+        with observe_label(label.name):
+            polydata = create_surface_polydata(extractor, smoothness, cancel, max_triangles=label.max_triangles)
+        if polydata is not None:
+            store_cached_surface(bone, 0, threshold, smoothness, polydata)
+            computed += 1
+    return computed
+
+
+def compute_bone_surface(bone, threshold, smoothness, cancel=None):
+    """
+    Applies a new threshold and smoothness to the bone surface and computes it, see compute_surface.
+    """
+    bone.labels[0].smoothness = smoothness
+    crop_to_threshold(bone, 0, threshold)
+    set_surface_value(bone, 0, threshold)
+    return compute_surface(bone, 0, cancel)
+
+
+def compute_bone_mesh(bone, threshold, smoothness, cancel=None):
+    """
+    Computes the bone surface with compute_bone_surface and its low resolution mesh, for show_surface.
+    :return: (vtkPolyData, low resolution vtkPolyData), or None if cancelled
+    """
+    return with_lod(compute_bone_surface(bone, threshold, smoothness, cancel))
+
+
+def create_preview_volume(bone, factor):
+    """
+    Subsamples the bone volume by factor along every axis. Subsampling (no averaging) keeps the original intensities,
+    so thresholds mean the same on the preview, and only touches one voxel out of factor^3.
+    (https://www.vtk.org/doc/nightly/html/classvtkImageShrink3D.html)
+    :return: the subsampled vtkImageData
+    """
+    shrink = observe(vtk.vtkImageShrink3D())
+    shrink.SetInputData(bone.reader.GetOutput())
+    shrink.SetShrinkFactors(factor, factor, factor)
+    shrink.AveragingOff()
+    shrink.Update()
+    return shrink.GetOutput()
+
+
+def get_preview_volume(bone, factor):
+    """
+    :return: the bone volume subsampled by factor (factor 1 is the full resolution volume). Subsampled volumes are
+    built on first use and kept in bone.previews.
+    """
+    if factor == 1:
+        return bone.reader.GetOutput()
+    if factor not in bone.previews:
+        bone.previews[factor] = create_preview_volume(bone, factor)
+    return bone.previews[factor]
+
+
+def compute_preview_surface(image, threshold, cancel=None):
+    """
+    Extracts an undecimated, unsmoothed surface from a (preview) volume.
+    :param cancel: optional threading.Event, the extraction is aborted once it is set
+    :return: the vtkPolyData with normals
+    """
+    extractor = observe(vtk.vtkFlyingEdges3D())
+    extractor.SetInputData(image)
+    extractor.SetValue(0, threshold)
+    extractor.ComputeNormalsOn()
+    abort_on_cancel(extractor, cancel)
+    extractor.Update()
+    return extractor.GetOutput()
+
+
+def preview_factors(bone):
+    """
+    :return: the subsampling factors of the preview stages from coarse to fine. The first stage is the finest one
+    expected to be extracted within PREVIEW_LATENCY seconds at the extraction rate measured on earlier previews.
+    """
+    factors = sorted(PREVIEW_FACTORS)
+    budget = PREVIEW_LATENCY * bone.preview_rate
+    first = next((f for f in factors if extent_size(bone.extent) / f ** 3 <= budget), factors[-1])
+    return [f for f in reversed(factors) if f <= first]
+
+
+def compute_bone_surface_progressive(bone, threshold, smoothness, cancel=None):
+    """
+    Generator yielding bone meshes for show_surface for a new threshold from coarse to fine: previews extracted from
+    subsampled volumes (see preview_factors) without a low resolution mesh, then the finished surface from
+    compute_bone_mesh. A cached finished surface is yielded directly, still through compute_bone_mesh so the bone
+    label takes the new threshold, smoothness and crop.
+    """
+    if load_cached_surface(bone, 0, threshold, smoothness) is not None:
+        yield compute_bone_mesh(bone, threshold, smoothness, cancel)
+        return
+
+    for factor in preview_factors(bone):
+        image = get_preview_volume(bone, factor)
+        start = time.perf_counter()
+        with observe_label('bone preview'):
+            polydata = compute_preview_surface(image, threshold, cancel)
+        if cancel is not None and cancel.is_set():  # an aborted preview is incomplete and too fast to measure
+            return
+        bone.preview_rate = image.GetNumberOfPoints() / max(time.perf_counter() - start, 1e-6)
+        yield polydata, None
+    yield compute_bone_mesh(bone, threshold, smoothness, cancel)
+
+
+def compute_label_surfaces(mask, label_indices, smoothness, cancel=None):
+    """
+    Applies a new smoothness to mask labels and computes their surfaces, extracting labels that were not built yet.
+    :return: dict of label index -> (vtkPolyData, low resolution vtkPolyData) for show_surface, or None if cancelled
+    """
+    surfaces = {}
+    for label_idx in label_indices:
+        label = mask.labels[label_idx]
+        label.smoothness = smoothness
+        if label.extractor is None:
+            label.extractor = create_mask_extractor(mask, source=label.voi)
+            set_surface_value(mask, label_idx, label.value)
+        surfaces[label_idx] = with_lod(compute_surface(mask, label_idx, cancel))
+        if surfaces[label_idx] is None:
+            return None
+    return surfaces
+
+
+def create_slab_image(slab, z0, spacing):
+    """
+    Wraps a [z, y, x] slab of a volume (see niftiUtils.iter_nifti_slabs) in a vtkImageData placed at slice z0, without
+    copying it. Keep the slab alive while the image is used.
+    """
+    image = vtk.vtkImageData()
+    image.SetExtent(0, slab.shape[2] - 1, 0, slab.shape[1] - 1, z0, z0 + slab.shape[0] - 1)
+    image.SetSpacing(spacing)
+    image.GetPointData().SetScalars(numpy_support.numpy_to_vtk(
+        slab.ravel(), array_type=numpy_support.get_vtk_array_type(slab.dtype)))
+    return image
+
+
+def stream_surface(file_name, value, smoothness, label=False, memory_budget=STREAM_MEMORY_BUDGET, cancel=None):
+    """
+    Extracts a surface from a volume that does not have to fit in memory. The volume is read in slabs sized to the
+    memory budget, each slab is extracted and decimated on its own, keeping the vertices on its boundary, and the
+    pieces are stitched by merging the coincident boundary vertices before the whole surface is smoothed:
+
+        slab -> extractor -> decimate (boundary kept) -> append -> clean (stitch) -> smoother -> normals
+
+    Since the vertices on the slab boundaries are kept, the decimation differs from that of the one piece surface and
+    the number of triangles is close to, not equal to, that of create_surface_polydata.
+    :param file_name: a '.nii' or '.nii.gz' file supported by niftiUtils
+    :param value: the threshold, or the label value if label is set
+    :param smoothness: the smoothness spin box value, see create_smoother
+    :param label: extract a label of a mask with vtkDiscreteMarchingCubes instead of a threshold surface
+    :param memory_budget: bytes the slabs and their extracted pieces may use together, at least enough for slabs of
+    two slices (ValueError otherwise)
+    :param cancel: optional threading.Event, the extraction stops once it is set
+    :return: the vtkPolyData (None if cancelled) and dict with the number of slabs, the peak memory of the slabs and
+    pieces (peak_memory) and the growth of the peak resident memory of the process (peak_rss), both in bytes
+    """
+    stream, header = open_nifti(file_name)
+    if stream is None:
+        raise ValueError("{} is not a volume niftiUtils can stream".format(file_name))
+    start_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    slice_size = int(np.prod(header['shape'][1:])) * header['dtype'].itemsize
+    depth = int(memory_budget // (slice_size * STREAM_MEMORY_FACTOR))
+    if depth < 2:
+        raise ValueError("A memory budget of {} bytes is below the {} bytes of a slab of two slices".format(
+            memory_budget, 2 * slice_size * STREAM_MEMORY_FACTOR))
+
+    pieces = vtk.vtkAppendPolyData()
+    pieces_size = peak_memory = slabs = 0
+    with stream:
+        for z0, slab in iter_nifti_slabs(stream, header, depth):
+            if cancel is not None and cancel.is_set():
+                return None, None
+            slabs += 1
+            extractor = observe(vtk.vtkDiscreteMarchingCubes() if label else vtk.vtkFlyingEdges3D())
+            extractor.SetInputData(create_slab_image(slab, z0, header['spacing']))
+            extractor.SetValue(0, value)
+            extractor.ComputeNormalsOff()  # recomputed on the stitched surface
+            extractor.Update()
+            if not extractor.GetOutput().GetNumberOfCells():
+                continue
+
+            reducer = create_polygon_reducer(extractor)
+            reducer.BoundaryVertexDeletionOff()  # the slab boundary is where the pieces are stitched
+            reducer.Update()
+            piece = vtk.vtkPolyData()
+            piece.ShallowCopy(reducer.GetOutput())
+            pieces.AddInputData(piece)
+            pieces_size += piece.GetActualMemorySize() * 1024
+            peak_memory = max(peak_memory, slab.nbytes + extractor.GetOutput().GetActualMemorySize() * 1024 +
+                              pieces_size)
+
+    if not pieces.GetNumberOfInputConnections(0):
+        return vtk.vtkPolyData(), {'slabs': slabs, 'peak_memory': peak_memory, 'peak_rss': 0}
+    stitcher = observe(vtk.vtkCleanPolyData())
+    stitcher.SetInputConnection(pieces.GetOutputPort())
+    stitcher.PointMergingOn()
+    stitcher.SetTolerance(0.0)
+    normals = create_normals(create_smoother(stitcher, smoothness))
+    abort_on_cancel(normals, cancel)
+    normals.Update()
+    if cancel is not None and cancel.is_set():
+        return None, None
+    rss = (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - start_rss) * 1024  # reported in kibibytes
+    return detach_output(normals), {'slabs': slabs, 'peak_memory': peak_memory, 'peak_rss': rss}
+
+
+def show_surface(nii_object, label_idx, polydata, lod=None):
+    """
+    Shows a mesh in the label actor, which is created the first time the label has data. Only swaps the meshes into
+    the mappers, so it is cheap enough for the Qt thread.
+    :param lod: the low resolution mesh of polydata (see with_lod), None to draw polydata itself while moving
+    :return: the actor of the label, None if the label has no data
+    """
+    label = nii_object.labels[label_idx]
+    with observe_label(label.name):
+        if label.actor:
+            set_actor_polydata(label.actor, polydata, lod)
+        elif polydata.GetNumberOfCells():
+            label.property = create_property(label.opacity, label.color)
+            label.actor = create_actor(create_mapper(polydata), label.property, lod)
+    return label.actor
+
+
+def update_surface_rendering(nii_object, label_idx):
+    """
+    (Re)computes the mesh of a label from its current value and smoothness and shows it in the label actor.
+    :param nii_object: the NiiObject owning the label
+    :param label_idx: index of the label in nii_object.labels
+    """
+    show_surface(nii_object, label_idx, *with_lod(compute_surface(nii_object, label_idx)))
 
 
 def setup_slicer(renderer, bone):
@@ -179,8 +923,10 @@ def setup_slicer(renderer, bone):
     axial = vtk.vtkImageActor()
     axial_prop = vtk.vtkImageProperty()
     axial_prop.SetOpacity(0)
+    axial_prop.SetLookupTable(bone.lookup_table)
+    axial_prop.UseLookupTableScalarRangeOn()
     axial.SetProperty(axial_prop)
-    axial.GetMapper().SetInputConnection(bone.image_mapper.GetOutputPort())
+    axial.GetMapper().SetInputConnection(bone.reader.GetOutputPort())
     axial.SetDisplayExtent(0, x, 0, y, int(z/2), int(z/2))
     axial.InterpolateOn()
     axial.ForceOpaqueOn()
@@ -188,8 +934,10 @@ def setup_slicer(renderer, bone):
     coronal = vtk.vtkImageActor()
     cor_prop = vtk.vtkImageProperty()
     cor_prop.SetOpacity(0)
+    cor_prop.SetLookupTable(bone.lookup_table)
+    cor_prop.UseLookupTableScalarRangeOn()
     coronal.SetProperty(cor_prop)
-    coronal.GetMapper().SetInputConnection(bone.image_mapper.GetOutputPort())
+    coronal.GetMapper().SetInputConnection(bone.reader.GetOutputPort())
     coronal.SetDisplayExtent(0, x, int(y/2), int(y/2), 0, z)
     coronal.InterpolateOn()
     coronal.ForceOpaqueOn()
@@ -197,8 +945,10 @@ def setup_slicer(renderer, bone):
     sagittal = vtk.vtkImageActor()
     sag_prop = vtk.vtkImageProperty()
     sag_prop.SetOpacity(0)
+    sag_prop.SetLookupTable(bone.lookup_table)
+    sag_prop.UseLookupTableScalarRangeOn()
     sagittal.SetProperty(sag_prop)
-    sagittal.GetMapper().SetInputConnection(bone.image_mapper.GetOutputPort())
+    sagittal.GetMapper().SetInputConnection(bone.reader.GetOutputPort())
     sagittal.SetDisplayExtent(int(x/2), int(x/2), 0, y, 0, z)
     sagittal.InterpolateOn()
     sagittal.ForceOpaqueOn()
@@ -220,21 +970,117 @@ def setup_projection(bone, renderer):
     bone_image_prop = vtk.vtkImageProperty()
     bone_image_prop.SetOpacity(0.0)
     bone_image_prop.SetInterpolationTypeToLinear()
+    bone_image_prop.SetLookupTable(bone.lookup_table)
+    bone_image_prop.UseLookupTableScalarRangeOn()
     image_slice = vtk.vtkImageSlice()
     image_slice.SetMapper(slice_mapper)
     image_slice.SetProperty(bone_image_prop)
-    image_slice.GetMapper().SetInputConnection(bone.image_mapper.GetOutputPort())
     renderer.AddViewProp(image_slice)
     return bone_image_prop
 
 
-def setup_bone(renderer, file):
+def setup_volume_rendering(bone, renderer):
+    """
+    Renders the bone volume directly with a multithreaded CPU ray caster, as an alternative to its surface. Works
+    offscreen and without a GPU. The volume is hidden until shown, see set_volume_transfer.
+    (https://www.vtk.org/doc/nightly/html/classvtkFixedPointVolumeRayCastMapper.html)
+    :return: the vtkVolume
+    """
+    mapper = vtk.vtkFixedPointVolumeRayCastMapper()
+    mapper.SetInputConnection(bone.reader.GetOutputPort())
+    mapper.SetNumberOfThreads(VOLUME_THREADS)
+    mapper.AutoAdjustSampleDistancesOn()  # coarser rays while interacting
+
+    volume_property = vtk.vtkVolumeProperty()
+    volume_property.SetInterpolationTypeToLinear()
+    volume_property.ShadeOn()
+    volume_property.SetScalarOpacity(vtk.vtkPiecewiseFunction())
+    volume_property.SetColor(vtk.vtkColorTransferFunction())
+
+    volume = vtk.vtkVolume()
+    volume.SetMapper(mapper)
+    volume.SetProperty(volume_property)
+    volume.VisibilityOff()
+    renderer.AddVolume(volume)
+    bone.volume = volume
+    set_volume_transfer(bone, bone.labels[0].value, bone.labels[0].opacity)
+    return volume
+
+
+def set_volume_transfer(bone, threshold, opacity):
+    """
+    Makes the voxels above the threshold visible with the given opacity, ramping up over VOLUME_OPACITY_RAMP of the
+    scalar range. Only edits the transfer functions, the volume is not re-read.
+    """
+    low, high = bone.scalar_range
+    ramp = max((high - low) * VOLUME_OPACITY_RAMP, 1e-6)
+    volume_property = bone.volume.GetProperty()
+
+    scalar_opacity = volume_property.GetScalarOpacity()
+    scalar_opacity.RemoveAllPoints()
+    scalar_opacity.AddPoint(min(low, threshold - ramp), 0.0)
+    scalar_opacity.AddPoint(threshold - ramp, 0.0)
+    scalar_opacity.AddPoint(threshold, opacity)
+    scalar_opacity.AddPoint(max(high, threshold), opacity)
+
+    color = volume_property.GetRGBTransferFunction()
+    color.RemoveAllPoints()
+    color.AddRGBPoint(threshold, *bone.labels[0].color)
+    color.AddRGBPoint(max(high, threshold), 1.0, 1.0, 1.0)
+
+
+def reset_camera(renderer):
+    """
+    Resets the camera to the scene.
+    :return: the camera, its focal point and its distance to the focal point
+    """
+    renderer.ResetCamera()
+    camera = renderer.GetActiveCamera()
+    fp = camera.GetFocalPoint()
+    p = camera.GetPosition()
+    return camera, fp, math.sqrt((p[0] - fp[0]) ** 2 + (p[1] - fp[1]) ** 2 + (p[2] - fp[2]) ** 2)
+
+
+def set_axial_camera(renderer):
+    camera, fp, dist = reset_camera(renderer)
+    camera.SetPosition(fp[0], fp[1], fp[2] + dist)
+    camera.SetViewUp(0.0, 1.0, 0.0)
+    camera.Zoom(1.8)
+    renderer.ResetCameraClippingRange()  # the camera moved away from where ResetCamera placed it
+
+
+def set_coronal_camera(renderer):
+    camera, fp, dist = reset_camera(renderer)
+    camera.SetPosition(fp[0], fp[2] - dist, fp[1])
+    camera.SetViewUp(0.0, 0.5, 0.5)
+    camera.Zoom(1.8)
+    renderer.ResetCameraClippingRange()  # the camera moved away from where ResetCamera placed it
+
+
+def set_sagittal_camera(renderer):
+    camera, fp, dist = reset_camera(renderer)
+    camera.SetPosition(fp[2] + dist, fp[0], fp[1])
+    camera.SetViewUp(0.0, 0.0, 1.0)
+    camera.Zoom(1.6)
+    renderer.ResetCameraClippingRange()  # the camera moved away from where ResetCamera placed it
+
+
+def read_bone(file):
+    """
+    Reads the bone volume and prepares its surface (without extracting it), see build_bone.
+    :param file: the bone filename of type 'nii.gz'
+    :return: the bone NiiObject
+    """
     bone = NiiObject()
     bone.file = file
-    bone.reader = read_volume(bone.file)
+    bone.file_hash = mesh_cache.hash_file(file) if mesh_cache else None
+    with observe_label('bone'):
+        bone.reader = read_volume(bone.file)
     bone.labels.append(NiiLabel(BONE_COLORS[0], BONE_OPACITY, BONE_SMOOTHNESS))
-    bone.labels[0].extractor = create_bone_extractor(bone)
+    bone.labels[0].name = 'bone'
     bone.extent = bone.reader.GetDataExtent()
+    bone.labels[0].voi = create_voi(bone, bone.extent)
+    bone.labels[0].extractor = create_bone_extractor(bone, bone.labels[0].voi)
 
     scalar_range = bone.reader.GetOutput().GetScalarRange()
     bw_lut = vtk.vtkLookupTable()
@@ -244,29 +1090,170 @@ def setup_bone(renderer, file):
     bw_lut.SetValueRange(0, 2)
     bw_lut.Build()
 
-    view_colors = vtk.vtkImageMapToColors()
-    view_colors.SetInputConnection(bone.reader.GetOutputPort())
-    view_colors.SetLookupTable(bw_lut)
-    view_colors.Update()
-    bone.image_mapper = view_colors
+    bone.lookup_table = bw_lut  # applied by the slice views to the displayed slices only
     bone.scalar_range = scalar_range
 
-    add_surface_rendering(bone, 0, sum(scalar_range)/2)  # render index, default extractor value
+    bone.labels[0].value = sum(scalar_range)/2  # default extractor value
+    bone.labels[0].estimated_triangles = estimate_threshold_triangles(get_volume_array(bone), bone.labels[0].value)
+    return bone
+
+
+def build_bone(renderer, bone):
+    """
+    Extracts the bone surface of a bone read by read_bone and adds its actor to the renderer.
+    :return: the bone NiiObject
+    """
+    crop_to_threshold(bone, 0, bone.labels[0].value)
+    add_surface_rendering(bone, 0, bone.labels[0].value)  # render index, default extractor value
     renderer.AddActor(bone.labels[0].actor)
     return bone
 
 
-def setup_mask(renderer, file):
+def setup_bone(renderer, file):
+    return build_bone(renderer, read_bone(file))
+
+
+def create_label_colors(n_labels):
+    """
+    Generates one color per label. The first colors come from MASK_COLORS, the rest are spread around the hue circle
+    using the golden ratio so neighbouring labels stay distinguishable for any number of labels.
+    :param n_labels: the number of colors to generate
+    :return: list of RGB percentages
+    """
+    colors = list(MASK_COLORS[:n_labels])
+    hue = 0.0
+    while len(colors) < n_labels:
+        hue = (hue + 0.618033988749895) % 1.0
+        saturation, value = (1.0, 1.0) if len(colors) % 2 else (0.6, 0.9)
+        colors.append(colorsys.hsv_to_rgb(hue, saturation, value))
+    return colors
+
+
+def build_surfaces_in_pool(mask, label_indices, workers):
+    """
+    Runs the surface pipeline of mask labels in a pool of worker processes sharing the label volume, see poolUtils.
+    :return: dict of label index -> vtkPolyData
+    """
+    from poolUtils import create_worker_pool, build_label_surface, unpack_polydata
+
+    pool, memory = create_worker_pool(get_volume_array(mask), mask.reader.GetOutput(), workers)
+    try:
+        futures = [pool.submit(build_label_surface, label_idx, label.value, label.voi.GetVOI(), label.smoothness,
+                               SMOOTHING_ENGINE, label.max_triangles, label.name)
+                   for label_idx, label in ((i, mask.labels[i]) for i in label_indices)]
+        surfaces = {}
+        for label_idx, packed, records in (f.result() for f in futures):
+            surfaces[label_idx] = unpack_polydata(packed)
+            if pipeline_observer:
+                pipeline_observer.extend(records)
+        return surfaces
+    finally:
+        pool.shutdown()
+        memory.close()
+        memory.unlink()
+
+
+def read_mask(file):
+    """
+    Reads the mask and creates one label per distinct non zero value in the volume, without extracting any surface
+    (see build_mask).
+    :param file: the mask filename of type 'nii.gz'
+    :return: the mask NiiObject
+    """
     mask = NiiObject()
     mask.file = file
-    mask.reader = read_volume(mask.file)
+    mask.file_hash = mesh_cache.hash_file(file) if mesh_cache else None
+    with observe_label('mask'):
+        mask.reader = read_volume(mask.file)
     mask.extent = mask.reader.GetDataExtent()
-    n_labels = int(mask.reader.GetOutput().GetScalarRange()[1])
-    n_labels = n_labels if n_labels <= 10 else 10
-
-    for label_idx in range(n_labels):
-        mask.labels.append(NiiLabel(MASK_COLORS[label_idx], MASK_OPACITY, MASK_SMOOTHNESS))
-        mask.labels[label_idx].extractor = create_mask_extractor(mask)
-        add_surface_rendering(mask, label_idx, label_idx + 1)
-        renderer.AddActor(mask.labels[label_idx].actor)
+
+    array = get_volume_array(mask)
+    label_extents = compute_label_extents(array, mask.extent)
+    label_triangles = estimate_label_triangles(array)
+    label_values = sorted(label_extents)
+    for label_value, color in zip(label_values, create_label_colors(len(label_values))):
+        mask.labels.append(NiiLabel(color, MASK_OPACITY, MASK_SMOOTHNESS, label_value))
+        mask.labels[-1].name = 'label {}'.format(label_value)
+        mask.labels[-1].voi = create_voi(mask, label_extents[label_value])
+        mask.labels[-1].estimated_triangles = label_triangles.get(label_value, 0)
+    return mask
+
+
+def compute_mask_statistics(mask, bone=None):
+    """
+    Computes the voxel count, volume, centroid and intensity statistics of every mask label in one sweep over the
+    volumes already read, see statisticsUtils.compute_label_statistics. The intensities are those of the bone scan,
+    when it has the extent of the mask.
+    :return: dict of label value -> statistics, centroids in world coordinates
+    """
+    image = mask.reader.GetOutput()
+    spacing = image.GetSpacing()
+    origin = [image.GetOrigin()[axis] + mask.extent[2 * axis] * spacing[axis] for axis in range(3)]
+    intensities = get_volume_array(bone) if bone is not None and tuple(bone.extent) == tuple(mask.extent) else None
+    return compute_label_statistics(get_volume_array(mask), spacing, origin, intensities)
+
+
+def build_mask(renderer, mask, strategy='auto', workers=MASK_WORKERS):
+    """
+    Extracts the surfaces of the first MASK_EAGER_LABELS labels of a mask read by read_mask and adds their actors to
+    the renderer. The other labels are extracted with compute_label_surfaces when first shown.
+    :param renderer: the vtkRenderer the label actors are added to
+    :param mask: the mask NiiObject
+    :param strategy: how the surfaces of the eager labels are extracted
+        'cropped': one extraction per label, restricted to the padded bounding box of the label
+        'single_pass': one vtkDiscreteMarchingCubes pass over the whole volume, split per label afterwards
+        'per_label': one full-volume extraction per label
+        'auto': 'cropped' when the label bounding boxes together hold fewer voxels than the volume, else 'single_pass'
+    :param workers: number of processes running the cropped pipeline of the labels that are not cached. The pool is
+    only used for at least MASK_POOL_MIN_LABELS such labels, since starting the workers takes a moment.
+    :return: the mask NiiObject
+    """
+    eager_values = [label.value for label in mask.labels[:MASK_EAGER_LABELS]]
+    if strategy == 'auto':
+        cropped_size = sum(extent_size(label.voi.GetVOI()) for label in mask.labels[:MASK_EAGER_LABELS])
+        strategy = 'cropped' if cropped_size < extent_size(mask.extent) else 'single_pass'
+
+    pooled = {}
+    if strategy == 'cropped' and workers > 1:
+        uncached = [label_idx for label_idx, label_value in enumerate(eager_values)
+                    if load_cached_surface(mask, label_idx, label_value, MASK_SMOOTHNESS) is None]
+        if len(uncached) >= MASK_POOL_MIN_LABELS:
+            pooled = build_surfaces_in_pool(mask, uncached, workers)
+            for label_idx, polydata in pooled.items():
+                store_cached_surface(mask, label_idx, eager_values[label_idx], MASK_SMOOTHNESS, polydata)
+
+    if strategy == 'single_pass' and eager_values:
+        extractor = create_mask_extractor(mask, eager_values)  # executed on the first mesh cache miss
+
+    for label_idx, label_value in enumerate(eager_values):
+        label = mask.labels[label_idx]
+        if strategy == 'single_pass':
+            label.extractor = extractor
+            label.surface = create_label_selector(extractor, label_value)
+        else:
+            label.extractor = create_mask_extractor(mask, source=label.voi if strategy == 'cropped' else None)
+        if label_idx in pooled:
+            set_surface_value(mask, label_idx, label_value)
+            show_surface(mask, label_idx, *with_lod(pooled[label_idx]))
+        else:
+            add_surface_rendering(mask, label_idx, label_value)
+        if label.actor:
+            renderer.AddActor(label.actor)
     return mask
+
+
+def setup_mask(renderer, file, strategy='auto', workers=MASK_WORKERS):
+    return build_mask(renderer, read_mask(file), strategy, workers)
+
+
+def setup_scene(renderer, bone_file, mask_file, triangle_budget=SCENE_TRIANGLE_BUDGET):
+    """
+    Reads the bone and the mask, splits the triangle budget over all their surfaces (see apply_triangle_budget) and
+    builds them.
+    :param triangle_budget: the maximum number of triangles of the scene, None to use MESH_REDUCTION instead
+    :return: the bone and mask NiiObjects
+    """
+    bone, mask = read_bone(bone_file), read_mask(mask_file)
+    if triangle_budget:
+        apply_triangle_budget([bone, mask], triangle_budget)
+    return build_bone(renderer, bone), build_mask(renderer, mask)